@@ -4,3 +4,13 @@ register(
     id='BEVCommunity-v0',
     entry_point='gym_BEVPro.envs:BEVCommunity',
 )
+
+register(
+    id='BEVCommunityVec-v0',
+    entry_point='gym_BEVPro.envs:BEVCommunityVec',
+)
+
+register(
+    id='BEVFeeder-v0',
+    entry_point='gym_BEVPro.envs:BEVFeeder',
+)
@@ -9,7 +9,7 @@ from model import *
 
 '''
 In this version:
-1. The time step is fixed at 1 hour
+1. The time step is 1 hour or a fraction of 1 hour, and the horizon can span several years
 2. Vehicle-to-grid interaction is not supported
 '''
 class BEVCommunity(gym.Env):
@@ -42,26 +42,54 @@ class BEVCommunity(gym.Env):
             positive means charging vehicles, negative means dischargingg to grid/buildings, [kW]
     """
 
-    def __init__(self, building_list, re_list, vehicle_list, battery_info, powerplant_num):
+    def __init__(self, building_list, re_list, vehicle_list, battery_info, powerplant_num, vectorized=True,
+                 stepLenth=3600, simulationYear=2019, horizon=8760, reuse_obs=False, profiler=None):
         '''
         In this version: 
-            -- The step length is fixed at 1 hour
+            -- vectorized: step all vehicles in one pass through a VehicleFleet, 
+               set to False to step the Vehicle objects one by one
+            -- stepLenth: length of time step, 1 hour or a fraction of 1 hour, unit: s
+            -- simulationYear: year of the first time step
+            -- horizon: simulated hours, each year of the horizon has 8760 hours as the input profiles,
+               which repeat every year
+            -- reuse_obs: return the same float32 state array from reset() and step(), which is overwritten
+               at the next step, instead of a new copy
+            -- profiler: a StepProfiler timing the phases of the constructor, reset() and step(), None for no instrumentation
             
         '''
         super().__init__()
         self.episode_idx = 0
         self.time_step_idx = 0
 
-        self.stepLenth =3600          # To be revised when the step length is not 1 hour
-        self.simulationYear = 2019    # Fixed in this version
+        assert 3600 % stepLenth == 0, "The step length needs to be 1 hour or a fraction of 1 hour."
+        self.stepLenth = stepLenth
+        self.simulationYear = simulationYear
+        self.horizon = horizon
+        self.n_steps = horizon*3600//self.stepLenth
+        self._timeIndex = None
+        # Calendar of each time step, built from the first week as the calendar repeats every week
+        # A day with weekday() of 0 is taken as a non-working day
         start_time = datetime(year = self.simulationYear, month = 1, day =1)
-        self.n_steps = 8760*3600//self.stepLenth   # Simulate a whole year
-        freq = '{}H'.format(self.stepLenth/3600)
-        self.timeIndex = pd.date_range(start_time, periods=self.n_steps, freq=freq)
+        weekSeconds = np.arange(7*86400//self.stepLenth, dtype=np.int64)*self.stepLenth
+        self.stepWeekday = np.resize(((start_time.weekday() + weekSeconds//86400) % 7).astype(np.int8), self.n_steps)
+        self.stepHour = np.resize((weekSeconds % 86400 // 3600).astype(np.int8), self.n_steps)
+        self.stepDayType = (self.stepWeekday != 0).astype(np.int8)
+        # Vehicles cruise once per day, at the first time step of the hour they return home
+        self.stepHourStart = np.resize(weekSeconds % 3600 == 0, self.n_steps)
+        self.dayTypes = self.stepDayType[::86400//self.stepLenth]
+        # Random generator and daily travel distances (n_days, n_vehicles) of the episode, see seed() and reset()
+        # Without them, the distances are drawn from the global random generator at each return hour
+        self.rng = None
+        self.distances = None
         
         # power plant quantity for charging vehicles
         self.plantNum = powerplant_num
 
+        # The profiler wraps the methods of the environment now, and those of the models once they are created
+        self.profiler = profiler
+        if profiler is not None:
+            profiler.attach(self)
+
         # Calculate the load for each time step
         self.buildingLoad = self._calculateBuildingLoad(building_list, self.stepLenth, self.simulationYear)
         self.reGeneration = self._calculateReGeneration(re_list, self.stepLenth, self.simulationYear)
@@ -76,6 +104,9 @@ class BEVCommunity(gym.Env):
             for _ in range(vehicle_tuple[1]):
                 vehicle = Vehicle(vehicle_tuple[0], self.vehicle_schl_file, self.stepLenth)
                 self.vehicles.append(vehicle)
+        # The fleet holds the battery state of all vehicles as arrays
+        self.fleet = VehicleFleet(self.vehicles, self.stepLenth)
+        self.vectorized = vectorized
 
         # define the state and action space
         vehicle_n = len(self.vehicles)           # Only control the vehicles
@@ -100,57 +131,63 @@ class BEVCommunity(gym.Env):
         self.observation_space = spaces.Box(low=self.obs_low, 
                                             high=self.obs_high, 
                                             dtype=np.float32)
+        # The state is written into one preallocated array
+        self.obs = np.zeros(len(self.obs_names), dtype=self.observation_space.dtype)
+        self.reuse_obs = reuse_obs
+        if profiler is not None:
+            profiler.attach(self)
+
+    @property
+    def timeIndex(self):
+        '''Time of each time step, built on first use
+        '''
+        if self._timeIndex is None:
+            start_time = datetime(year = self.simulationYear, month = 1, day =1)
+            self._timeIndex = pd.date_range(start_time, periods=self.n_steps, freq='{}S'.format(self.stepLenth))
+        return self._timeIndex
 
-    def reset(self):
+    def seed(self, seed=None):
+        '''Create the random generator of the daily travel distances, which are then drawn for the whole horizon at each reset
+        '''
+        self.rng = np.random.default_rng(seed)
+        return [seed]
+
+    def reset(self, seed=None, scenario=None):
+        '''
+        Args:
+            -- seed: seed the random generator of the daily travel distances, see seed()
+            -- scenario: array (n_days, n_vehicles) of the daily travel distances of this episode, e.g. one of an ensemble
+               of sampleScenario(), otherwise the distances are drawn when the environment is seeded,
+               or the previous scenario is kept
+        '''
+        if seed is not None:
+            self.seed(seed)
+        if scenario is not None:
+            scenario = np.asarray(scenario, dtype=float)
+            assert scenario.shape == (len(self.dayTypes), self.fleet.vehicleNum), "The scenario needs one row per day and one column per vehicle."
+            assert np.all(scenario >= 0), "The travel distances need to be non-negative."
+            self.distances = scenario
+        elif self.rng is not None:
+            self.distances = self.sampleScenario()
         self.episode_idx += 1
         self.time_step_idx = 0
         load = self._getLoad(self.time_step_idx)
-        batteryVol = [0]
-        batterySpare = [self.batteryOnsite.capacityMax]
-        vehicles_park = []
-        vehicles_max_dist = []
-        vehicles_SOC = []
-        
-        for vehicle in self.vehicles:
-            vehicle_park, vehicle_max_dist, _ = self._getVehicleStateStatic(vehicle)
-            vehicles_park.append(vehicle_park)
-            vehicles_max_dist.append(vehicle_max_dist)           
-            vehicles_SOC.append(vehicle.batterySOC)
-        obs = load + batteryVol + batterySpare + vehicles_park + vehicles_max_dist + vehicles_SOC
+        batteryVol = 0
+        batterySpare = self.batteryOnsite.capacityMax
+        vehicles_park, vehicles_max_dist, _ = self.fleet.getStateStatic(self.stepDayType[self.time_step_idx], 
+                                                                        self.stepHour[self.time_step_idx])
+        vehicles_SOC = self.fleet.batterySOC
+        obs = self._getObs(load, batteryVol, batterySpare, vehicles_park, vehicles_max_dist, vehicles_SOC)
 
         return obs
 
     def step(self, actions):
         load = self._getLoad(self.time_step_idx)
-        vehicles_park = []
-        vehicles_max_dist = []
-        vehicles_SOC = []
-        usedPlants = 0
-        totalVehicleCharge = 0
-        totalVehicletoGrid = 0
-        
-        for action, vehicle in zip(actions, self.vehicles):
-            vehicle_park, vehicle_max_dist, cruiseBackHour = self._getVehicleStateStatic(vehicle)
-            if action > 0:   # Charge the vehicle battery
-                if usedPlants < self.plantNum:
-                    realChargeRate = vehicle.vehicleCharge(action)
-                    totalVehicleCharge += realChargeRate
-                    if realChargeRate != 0:
-                        usedPlants += 1
-                else:
-                    realChargeRate = 0
-            else: # discharge the vehicle battery for powering the grid
-                realDischargePower = vehicle.eleToGrid(-action)
-                totalVehicletoGrid += realDischargePower
-            # Vehicle-stored electricity is reduced at the hour when the vehicle is back 
-            if cruiseBackHour:
-                workingDay = self.timeIndex[self.time_step_idx].weekday()
-                vehicle.cruise(workingDay)
-
-            vehicles_park.append(vehicle_park)
-            vehicles_max_dist.append(vehicle_max_dist)
-            vehicles_SOC.append(vehicle.batterySOC)
-
+        if self.vectorized:
+            vehicles_park, vehicles_max_dist, totalVehicleCharge, totalVehicletoGrid = self._stepFleet(actions)
+        else:
+            vehicles_park, vehicles_max_dist, totalVehicleCharge, totalVehicletoGrid = self._stepVehicles(actions)
+        vehicles_SOC = self.fleet.batterySOC
 
         renewableSurlpus =  max(0.95*load[1] - load[0] - totalVehicleCharge, 0)
         demandShoratge = max(load[0] - 0.95*load[1] + totalVehicleCharge, 0)
@@ -170,7 +207,7 @@ class BEVCommunity(gym.Env):
         totalGridLoad = load[0] - 0.95*load[1] + power_batteryCharge - power_batteryDischarge + totalVehicleCharge - totalVehicletoGrid
 
         reward = totalGridLoad
-        done = self.time_step_idx == len(self.timeIndex)-1
+        done = self.time_step_idx == self.n_steps-1
         comments = (power_batteryCharge, power_batteryDischarge, totalVehicleCharge, totalVehicletoGrid)
 
         self.time_step_idx += 1
@@ -178,34 +215,223 @@ class BEVCommunity(gym.Env):
             load = self._getLoad(self.time_step_idx-1)
         else:
             load = self._getLoad(self.time_step_idx)
-        obs = load + [batteryVol] + [batterySpare] + vehicles_park + vehicles_max_dist + vehicles_SOC
+        obs = self._getObs(load, batteryVol, batterySpare, vehicles_park, vehicles_max_dist, vehicles_SOC)
         return obs, reward, done, comments
 
+    def get_state(self, include_rng=True, out=None):
+        '''Mutable state of the environment as one flat float array, to branch the simulation with set_state()
+        The profiles, parameters and schedules are not part of the state, they are shared by all branches
+        ------------------------------------
+        Args
+            -- include_rng, also capture the random generator of the cruise distances
+            -- out, array of the same size to write the state into, e.g. a row of a preallocated array of branches
+        ------------------------------------
+        Output
+            -- [time_step_idx, onsite battery volume, vehicle battery volumes, vehicle SOCs, random generator state]
+               the random generator state is left out when the distances of the episode are drawn at reset
+        '''
+        vehicle_n = self.fleet.vehicleNum
+        rngState = self._getRngState() if include_rng else ()
+        state = np.empty(2+2*vehicle_n+len(rngState)) if out is None else out
+        state[0] = self.time_step_idx
+        state[1] = self.batteryOnsite.batteryVol
+        state[2:2+vehicle_n] = self.fleet.batteryVol
+        state[2+vehicle_n:2+2*vehicle_n] = self.fleet.batterySOC
+        state[2+2*vehicle_n:] = rngState
+        return state
+
+    def set_state(self, state):
+        '''Restore a state captured by get_state(), the random generator is restored when it was captured
+        '''
+        vehicle_n = self.fleet.vehicleNum
+        self.time_step_idx = int(state[0])
+        self.batteryOnsite.batteryVol = float(state[1])
+        self.fleet.batteryVol[:] = state[2:2+vehicle_n]
+        self.fleet.batterySOC[:] = state[2+vehicle_n:2+2*vehicle_n]
+        if len(state) > 2+2*vehicle_n:
+            self._setRngState(state[2+2*vehicle_n:])
+
+    def _getRngState(self):
+        '''State of the global random generator used for the cruise distances, as floats:
+        the 624 MT19937 keys, position, has_gauss and cached_gaussian
+        The generator is not used within an episode of drawn distances, so there is no state to keep
+        '''
+        if self.distances is not None:
+            return ()
+        _, keys, pos, has_gauss, cached_gaussian = np.random.get_state()
+        rngState = np.empty(len(keys)+3)
+        rngState[:-3] = keys
+        rngState[-3:] = pos, has_gauss, cached_gaussian
+        return rngState
+
+    def _setRngState(self, rngState):
+        rngState = np.asarray(rngState)
+        np.random.set_state(('MT19937', rngState[:-3].astype(np.uint32), int(rngState[-3]), int(rngState[-2]), float(rngState[-1])))
+
+    def sampleScenario(self, rng=None):
+        '''Draw the daily travel distances of all vehicles over the horizon, array (n_days, n_vehicles), unit: km
+        rng is a numpy random Generator, default the generator of the environment
+        '''
+        return self.fleet.sampleDistances(self.dayTypes, self.rng if rng is None else rng)
+
+    def rollout(self, action_matrix, record_soc=True):
+        '''Simulate fixed schedules of actions from the current time step and state, following the rules of step()
+        The environment itself is not changed. The cruise distances are those of the episode scenario, or are drawn from the global
+        random generator in the same order as step(), so all schedules of a batch share the same distances, and one schedule
+        reproduces the results of step(). The state of the global random generator is restored afterwards, so the next step()
+        draws the same distances as if the schedules had not been simulated
+        ------------------------------------
+        Args
+            -- action_matrix, array (n_steps, n_vehicles) of one schedule, or (n_schedules, n_steps, n_vehicles) of a batch
+            -- record_soc, also return the SOC trajectory of each vehicle
+        ------------------------------------
+        Output
+            -- dict of arrays of shape (n_steps,) for one schedule, or (n_schedules, n_steps) for a batch:
+               gridLoad (the reward), batteryVol (onsite battery after each step), the comments power_batteryCharge,
+               power_batteryDischarge, totalVehicleCharge, totalVehicletoGrid, and vehicleSOC with a last axis of vehicles
+        '''
+        actions = np.asarray(action_matrix, dtype=float)
+        single = actions.ndim == 2
+        if single:
+            actions = actions[None]
+        batchNum, stepNum, vehicle_n = actions.shape
+        assert vehicle_n == self.fleet.vehicleNum, "The action matrix needs one column per vehicle."
+        assert self.time_step_idx + stepNum <= self.n_steps, "The schedule runs beyond the horizon."
+
+        steps = np.arange(self.time_step_idx, self.time_step_idx+stepNum)
+        netLoad = np.asarray(self.buildingLoad[steps]) - 0.95*np.asarray(self.reGeneration[steps])
+        fleet = self.fleet.batch(batchNum)
+        batteryVol = np.full(batchNum, float(self.batteryOnsite.batteryVol))
+        results = {name: np.empty((batchNum, stepNum)) for name in
+                   ['gridLoad', 'batteryVol', 'power_batteryCharge', 'power_batteryDischarge', 'totalVehicleCharge', 'totalVehicletoGrid']}
+        if record_soc:
+            results['vehicleSOC'] = np.empty((batchNum, stepNum, vehicle_n), dtype=np.float32)
+
+        rngState = np.random.get_state() if self.distances is None else None
+        for step_i, t in enumerate(steps):
+            realChargeRate, realDischargeRate = fleet.chargeAndDischarge(actions[:, step_i], self.plantNum)
+            # Vehicle-stored electricity is reduced at the hour when the vehicle is back
+            if self.stepHourStart[t]:
+                dayType = self.stepDayType[t]
+                _, _, cruiseMask = fleet.getStateStatic(dayType, self.stepHour[t])
+                cruiseIdx = np.flatnonzero(cruiseMask)
+                if self.distances is not None:
+                    fleet.drive(cruiseMask, self.distances[t*self.stepLenth//86400])
+                elif cruiseIdx.size:
+                    distance = np.zeros(vehicle_n)
+                    distance[cruiseIdx] = fleet.drawCruiseDistances(cruiseIdx, dayType)
+                    fleet.drive(cruiseMask, distance)
+            totalVehicleCharge = realChargeRate.sum(axis=1)
+            totalVehicletoGrid = realDischargeRate.sum(axis=1)
+
+            renewableSurlpus = np.maximum(-netLoad[step_i] - totalVehicleCharge, 0)
+            demandShoratge = np.maximum(netLoad[step_i] + totalVehicleCharge, 0)
+            power_batteryCharge, power_batteryDischarge = self.batteryOnsite.batteryDispatch(renewableSurlpus, demandShoratge, batteryVol)
+
+            results['gridLoad'][:, step_i] = netLoad[step_i] + power_batteryCharge - power_batteryDischarge + totalVehicleCharge - totalVehicletoGrid
+            results['batteryVol'][:, step_i] = batteryVol
+            results['power_batteryCharge'][:, step_i] = power_batteryCharge
+            results['power_batteryDischarge'][:, step_i] = power_batteryDischarge
+            results['totalVehicleCharge'][:, step_i] = totalVehicleCharge
+            results['totalVehicletoGrid'][:, step_i] = totalVehicletoGrid
+            if record_soc:
+                results['vehicleSOC'][:, step_i] = fleet.batterySOC
+        if rngState is not None:
+            np.random.set_state(rngState)
+
+        if single:
+            results = {name: values[0] for name, values in results.items()}
+        return results
+
+    def _getObs(self, load, batteryVol, batterySpare, vehicles_park, vehicles_max_dist, vehicles_SOC):
+        '''Write the state into the preallocated state array
+        Return the state array itself when reuse_obs is set, otherwise a copy of it
+        '''
+        vehicle_n = self.fleet.vehicleNum
+        obs = self.obs
+        obs[0] = load[0]
+        obs[1] = load[1]
+        obs[2] = batteryVol
+        obs[3] = batterySpare
+        obs[4:4+vehicle_n] = vehicles_park
+        obs[4+vehicle_n:4+2*vehicle_n] = vehicles_max_dist
+        obs[4+2*vehicle_n:] = vehicles_SOC
+        return obs if self.reuse_obs else obs.copy()
+
+    def _stepFleet(self, actions):
+        '''Charge/discharge and cruise all vehicles in one vectorized pass through the fleet
+        Return: park states, predicted maximum travel distances, total charge power and total vehicle-to-grid power
+        '''
+        dayType = self.stepDayType[self.time_step_idx]
+        vehicles_park, vehicles_max_dist, cruiseMask = self.fleet.getStateStatic(dayType, self.stepHour[self.time_step_idx])
+
+        realChargeRate, realDischargeRate = self.fleet.chargeAndDischarge(actions, self.plantNum)
+        # Vehicle-stored electricity is reduced at the hour when the vehicle is back
+        if self.stepHourStart[self.time_step_idx]:
+            if self.distances is None:
+                self.fleet.cruise(cruiseMask, dayType)
+            else:
+                self.fleet.drive(cruiseMask, self.distances[self.time_step_idx*self.stepLenth//86400])
+        return vehicles_park, vehicles_max_dist, float(realChargeRate.sum()), float(realDischargeRate.sum())
+
+    def _stepVehicles(self, actions):
+        '''Charge/discharge and cruise the vehicles one by one
+        Return: park states, predicted maximum travel distances, total charge power and total vehicle-to-grid power
+        '''
+        vehicles_park = []
+        vehicles_max_dist = []
+        usedPlants = 0
+        totalVehicleCharge = 0
+        totalVehicletoGrid = 0
+
+        for vehicle_i, (action, vehicle) in enumerate(zip(actions, self.vehicles)):
+            vehicle_park, vehicle_max_dist, cruiseBackHour = self._getVehicleStateStatic(vehicle)
+            if action > 0:   # Charge the vehicle battery
+                if usedPlants < self.plantNum:
+                    realChargeRate = vehicle.vehicleCharge(action)
+                    totalVehicleCharge += realChargeRate
+                    if realChargeRate != 0:
+                        usedPlants += 1
+                else:
+                    realChargeRate = 0
+            else: # discharge the vehicle battery for powering the grid
+                realDischargePower = vehicle.eleToGrid(-action)
+                totalVehicletoGrid += realDischargePower
+            # Vehicle-stored electricity is reduced at the hour when the vehicle is back
+            if cruiseBackHour and self.stepHourStart[self.time_step_idx]:
+                if self.distances is None:
+                    vehicle.cruise(self.stepDayType[self.time_step_idx])
+                else:
+                    vehicle.cruise(self.stepDayType[self.time_step_idx], self.distances[self.time_step_idx*self.stepLenth//86400, vehicle_i])
+
+            vehicles_park.append(vehicle_park)
+            vehicles_max_dist.append(vehicle_max_dist)
+        return vehicles_park, vehicles_max_dist, totalVehicleCharge, totalVehicletoGrid
+
     def _calculateBuildingLoad(self, building_list, stepLenth, simulationYear):
         '''Calculate the total building load from the building list
         '''
-        
-        buildings = pd.DataFrame()
+        buildings = []
+        building_numbers = []
         for building_tuple in building_list:
             building_csv = building_tuple[0]
-            building_numbers = building_tuple[1]
-            building_obj = Building(building_csv, stepLenth, simulationYear)
-            building = building_obj.getLoadFullYear()*building_numbers
-            buildings = pd.concat([buildings,building], axis=1)
-        totalLoad = buildings.sum(axis=1).values
+            building_numbers.append(building_tuple[1])
+            building_obj = Building(building_csv, stepLenth, simulationYear, self.n_steps)
+            buildings.append(building_obj.values)
+        totalLoad = TimeSeriesProvider.combine(buildings, building_numbers, stepLenth, self.n_steps)
         return totalLoad
 
     def _calculateReGeneration(self, re_list, stepLenth, simulationYear):
         '''Calculate the total renewable generation from the renewable list
         '''
-        res = pd.DataFrame()
+        res = []
+        re_numbers = []
         for re_tuple in re_list:
             re_csv = re_tuple[0]
-            re_numbers = re_tuple[1]
-            re_obj = RE(re_csv, stepLenth, simulationYear)
-            re = re_obj.getPowerFullYear()*re_numbers
-            res = pd.concat([res,re], axis=1)
-        totalGeneration = res.sum(axis=1).values
+            re_numbers.append(re_tuple[1])
+            re_obj = RE(re_csv, stepLenth, simulationYear, self.n_steps)
+            res.append(re_obj.values)
+        totalGeneration = TimeSeriesProvider.combine(res, re_numbers, stepLenth, self.n_steps)
         return totalGeneration
     
     def _getLoad(self, time_step_idx):
@@ -221,15 +447,15 @@ class BEVCommunity(gym.Env):
                 predicted maximum travel distance
                 cruiseBackHour: Boolean, Whether it is the hour vehicle returns to home, the vehicle battery is discharged at this hour
         '''
-        weekday = self.timeIndex[self.time_step_idx].weekday()
-        hour = self.timeIndex[self.time_step_idx].hour
+        weekday = self.stepWeekday[self.time_step_idx]
+        hour = self.stepHour[self.time_step_idx]
         if weekday:
             vehicle_park = vehicle.parkSchd_wd[hour]
             cruiseHour = vehicle.parkSchd_wd.index[vehicle.parkSchd_wd==0].max()+1
             vehicle_max_dist = vehicle.dist_mu_wd+5*vehicle.dist_sigma_wd
         else:
             vehicle_park = vehicle.parkSchd_nwd[hour]
-            cruiseHour = vehicle.parkSchd_wd.index[vehicle.parkSchd_wd==0].max()+1
+            cruiseHour = vehicle.parkSchd_nwd.index[vehicle.parkSchd_nwd==0].max()+1
             vehicle_max_dist = vehicle.dist_mu_nwd+5*vehicle.dist_sigma_nwd
         cruiseBackHour = hour == cruiseHour
         return vehicle_park, vehicle_max_dist, cruiseBackHour
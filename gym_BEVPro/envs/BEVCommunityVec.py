@@ -0,0 +1,143 @@
+from gym.vector import VectorEnv
+
+import numpy as np
+
+from BEVCommunity import BEVCommunity
+
+'''
+In this version:
+1. All communities are built from the same inputs and step in lockstep
+2. The profiles and vehicle parameters are read once and shared by all communities
+'''
+class BEVCommunityVec(VectorEnv):
+    """ Batched version of BEVCommunity, which advances n_envs copies of the same community at once
+    ------------------------------------------------------------------------------------------------------
+    Args:
+        - building_list, re_list, vehicle_list, battery_info, powerplant_num: same as BEVCommunity
+        - stepLenth, simulationYear, horizon: optional, same as BEVCommunity
+        - n_envs: number of communities
+        - seed: seed of the random travel distances, each community draws from its own random generator
+    ------------------------------------------------------------------------------------------------------
+    States:
+        - array of shape (n_envs, obs_dim), each row is the state of one community as in BEVCommunity
+    ------------------------------------------------------------------------------------------------------
+    Actions:
+        - array of shape (n_envs, n_vehicles), each row is the action of one community as in BEVCommunity
+    ------------------------------------------------------------------------------------------------------
+    A community is reset automatically when its episode is done, the returned state is then the
+    initial state of the next episode, and the last state of the finished episode is put in
+    info['terminal_observation'].
+    """
+
+    def __init__(self, building_list, re_list, vehicle_list, battery_info, powerplant_num, n_envs=1, seed=None, **kwargs):
+        # The community holding the shared profiles, parameters and tables, kwargs are passed to BEVCommunity
+        self.community = BEVCommunity(building_list, re_list, vehicle_list, battery_info, powerplant_num, **kwargs)
+        super().__init__(n_envs, self.community.observation_space, self.community.action_space)
+
+        self.n_envs = n_envs
+        self.n_steps = self.community.n_steps
+        self.plantNum = self.community.plantNum
+        self.obs_names = self.community.obs_names
+        self.action_names = self.community.action_names
+        self.vehicleNum = self.community.fleet.vehicleNum
+
+        # State of each community
+        self.episode_idx = np.zeros(n_envs, dtype=np.int64)
+        self.time_step_idx = np.zeros(n_envs, dtype=np.int64)
+        self.batteryVol = np.zeros(n_envs)
+        self.fleet = self.community.fleet.batch(n_envs)
+        self.seed(seed)
+        # A profiler given in kwargs also times the batched fleet
+        if self.community.profiler is not None:
+            self.community.profiler.attach(self)
+
+        self._actions = None
+
+    @property
+    def timeIndex(self):
+        return self.community.timeIndex
+
+    def seed(self, seed=None):
+        '''Create independent random generators of the communities from one seed
+        '''
+        seedSeq = np.random.SeedSequence(seed)
+        self.np_random = [np.random.default_rng(childSeq) for childSeq in seedSeq.spawn(self.n_envs)]
+        return [seed]
+
+    def reset_wait(self, **kwargs):
+        self.episode_idx += 1
+        self.time_step_idx[:] = 0
+        return self._getResetObs(np.ones(self.n_envs, dtype=bool))
+
+    def step_async(self, actions):
+        actions = np.asarray(actions, dtype=float)
+        assert actions.shape == (self.n_envs, self.vehicleNum), \
+            "Actions need to be of shape (n_envs, n_vehicles) = ({}, {})".format(self.n_envs, self.vehicleNum)
+        self._actions = actions
+
+    def step_wait(self, **kwargs):
+        envIdx = np.arange(self.n_envs)
+        t = self.time_step_idx
+        buildingLoad = self.community.buildingLoad[t]
+        reGeneration = self.community.reGeneration[t]
+        dayType = self.community.stepDayType[t]
+        vehicles_park, vehicles_max_dist, cruiseMask = self.fleet.getStateStatic(dayType, self.community.stepHour[t])
+        cruiseMask = cruiseMask & self.community.stepHourStart[t][:, None]
+
+        realChargeRate, realDischargeRate = self.fleet.chargeAndDischarge(self._actions, self.plantNum)
+        # Vehicle-stored electricity is reduced at the hour when the vehicle is back
+        cruiseEnvs = envIdx[cruiseMask.any(axis=1)]
+        if cruiseEnvs.size:
+            distance = np.zeros((self.n_envs, self.vehicleNum))
+            for env_i in cruiseEnvs:
+                distance[env_i] = self._getDistance(env_i, dayType[env_i])
+            self.fleet.drive(cruiseMask, distance)
+        totalVehicleCharge = realChargeRate.sum(axis=1)
+        totalVehicletoGrid = realDischargeRate.sum(axis=1)
+
+        renewableSurlpus = np.maximum(0.95*reGeneration - buildingLoad - totalVehicleCharge, 0)
+        demandShoratge = np.maximum(buildingLoad - 0.95*reGeneration + totalVehicleCharge, 0)
+        power_batteryCharge, power_batteryDischarge = self.community.batteryOnsite.batteryDispatch(renewableSurlpus, demandShoratge, self.batteryVol)
+
+        totalGridLoad = buildingLoad - 0.95*reGeneration + power_batteryCharge - power_batteryDischarge + totalVehicleCharge - totalVehicletoGrid
+
+        rewards = totalGridLoad
+        dones = self.time_step_idx == self.n_steps-1
+        # As in BEVCommunity.step, the state holds the load of the next time step, or of the last one when done
+        self.time_step_idx = np.minimum(self.time_step_idx+1, self.n_steps-1)
+        obs = self._getObs(self.time_step_idx, self.batteryVol, vehicles_park, vehicles_max_dist, self.fleet.batterySOC)
+
+        infos = [{'comments': (power_batteryCharge[env_i], power_batteryDischarge[env_i], totalVehicleCharge[env_i], totalVehicletoGrid[env_i])}
+                 for env_i in envIdx]
+        if dones.any():
+            for env_i in envIdx[dones]:
+                infos[env_i]['terminal_observation'] = obs[env_i].copy()
+            self.episode_idx[dones] += 1
+            self.time_step_idx[dones] = 0
+            obs[dones] = self._getResetObs(dones)
+        return obs, rewards, dones, infos
+
+    def _getObs(self, t, batteryVol, vehicles_park, vehicles_max_dist, vehicles_SOC):
+        '''Build the stacked states of the communities
+        '''
+        obs = np.empty((t.size, len(self.obs_names)), dtype=self.single_observation_space.dtype)
+        obs[:, 0] = self.community.buildingLoad[t]
+        obs[:, 1] = self.community.reGeneration[t]
+        obs[:, 2] = batteryVol
+        obs[:, 3] = self.community.batteryOnsite.capacityMax - batteryVol
+        obs[:, 4:4+self.vehicleNum] = vehicles_park
+        obs[:, 4+self.vehicleNum:4+2*self.vehicleNum] = vehicles_max_dist
+        obs[:, 4+2*self.vehicleNum:] = vehicles_SOC
+        return obs
+
+    def _getResetObs(self, envMask):
+        '''Initial states of the given communities, the onsite battery is reported as empty as in BEVCommunity.reset
+        '''
+        t = self.time_step_idx[envMask]
+        vehicles_park, vehicles_max_dist, _ = self.fleet.getStateStatic(self.community.stepDayType[t], self.community.stepHour[t])
+        return self._getObs(t, 0, vehicles_park, vehicles_max_dist, self.fleet.batterySOC[envMask])
+
+    def _getDistance(self, env_i, dayType):
+        '''Draw the non-negative travel distances of all vehicles of a community from its own random generator
+        '''
+        return self.fleet.sampleDistances([dayType], self.np_random[env_i])[0]
@@ -1 +1,4 @@
 from gym_BEVPro.envs.BEVCommunity import BEVCommunity
+from gym_BEVPro.envs.BEVCommunityVec import BEVCommunityVec
+from gym_BEVPro.envs.feeder import BEVFeeder
+from gym_BEVPro.envs.server import EnvServer, EnvClient
@@ -0,0 +1,204 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import timeit
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+'''
+Benchmark suite of BEVCommunity
+1. Each fleet size runs in a fresh process with the shipped input profiles and a generated vehicle list,
+   so the peak memory of one size is not inherited by the next
+2. Measured: constructor time, reset() latency, steps per second over a whole episode (8760 steps by default) and peak RSS,
+   each timing is the best of several repeats, which is the least sensitive to the load of the machine
+3. The results are written as json, and can be compared with a stored baseline, the run fails beyond a relative slowdown
+   that is also larger than an absolute margin, so sub-millisecond timings do not fail on noise
+'''
+
+INPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'inputs')
+DEFAULT_SIZES = (10, 100, 1000, 10000, 30000)
+# Metrics compared with the baseline: whether a larger value is better, and the smallest difference counted as a slowdown
+COMPARED_METRICS = {'constructor_s': (False, 0.01), 'reset_ms': (False, 0.1), 'steps_per_s': (True, 0)}
+
+
+def fleet_lists(n_vehicles, n_buildings=30):
+    '''Building, renewable and vehicle lists of a community with n_vehicles vehicles, from the shipped input files
+    The vehicles are split evenly between the three vehicle types, and the buildings between the three building profiles
+    '''
+    inputs = lambda name: os.path.join(INPUT_DIR, name)
+    building_list = [(inputs('building{}.csv'.format(i)), n_buildings//3) for i in range(1, 4)]
+    re_list = [(inputs('renewable{}.csv'.format(i)), n_buildings//3) for i in range(1, 4)]
+    vehicle_list = [inputs('vehicle_atHomeSchd.csv')]
+    for i in range(3):
+        number = n_vehicles//3 + (1 if i < n_vehicles % 3 else 0)
+        if number:
+            vehicle_list.append((inputs('vehicle{}.csv'.format(i+1)), number))
+    return building_list, re_list, vehicle_list, inputs('battery_info.csv')
+
+
+def peak_rss_mb():
+    '''Peak resident set size of the current process, unit: MB, None where the resource module is not available
+    '''
+    try:
+        import resource
+    except ImportError:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return maxrss/2**20 if sys.platform == 'darwin' else maxrss/2**10
+
+
+def benchmark_size(n_vehicles, horizon=8760, resets=20, seed=0, repeats=5):
+    '''Benchmark one fleet size in the current process, each timing is the best of repeats runs
+    The vehicles get random charge/discharge actions, drawn beforehand for one day and repeated
+    '''
+    from BEVCommunity import BEVCommunity
+    from cache import profileCache
+
+    building_list, re_list, vehicle_list, battery_info = fleet_lists(n_vehicles)
+    makeEnv = lambda: BEVCommunity(building_list, re_list, vehicle_list, battery_info, max(n_vehicles//2, 1), horizon=horizon)
+    # The in-memory cache entries are dropped before each run, so every run reads the cache like the first one
+    constructor_s = min(timeit.repeat(makeEnv, setup=profileCache.clearMemory, number=1, repeat=repeats))
+    env = makeEnv()
+
+    reset_ms = min(timeit.repeat(env.reset, number=resets, repeat=repeats))/resets*1000
+
+    rng = np.random.RandomState(seed)
+    dailyActions = rng.uniform(-30, 60, (24, n_vehicles)) * (rng.rand(24, n_vehicles) < 0.7)
+
+    def episode():
+        for step_i in range(env.n_steps):
+            env.step(dailyActions[step_i % 24])
+
+    def setup():
+        np.random.seed(seed)
+        env.reset()
+
+    episode_s = min(timeit.repeat(episode, setup=setup, number=1, repeat=repeats))
+
+    return {
+        'n_vehicles': n_vehicles,
+        'n_steps': env.n_steps,
+        'constructor_s': constructor_s,
+        'reset_ms': reset_ms,
+        'episode_s': episode_s,
+        'steps_per_s': env.n_steps/episode_s,
+        'repeats': repeats,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, horizon=8760, resets=20, cold_cache=False, repeats=5):
+    '''Benchmark each fleet size in its own fresh process
+    ------------------------------------
+    Args
+        -- sizes, numbers of vehicles
+        -- horizon, number of hours of the benchmarked episode
+        -- resets, number of reset() calls averaged for the reset latency
+        -- cold_cache, keep the profile cache in memory only, so the constructor parses every input file
+        -- repeats, number of runs of each timing, the best is kept
+    ------------------------------------
+    Output
+        -- dict of the environment description and the list of results of each size
+    '''
+    # The spawned processes read the cache directory from the environment, it is restored afterwards
+    cacheDir = os.environ.get('BEVPRO_CACHE_DIR')
+    if cold_cache:
+        os.environ['BEVPRO_CACHE_DIR'] = ''
+    context = multiprocessing.get_context('spawn')
+    results = []
+    try:
+        for n_vehicles in sizes:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context, initializer=_setPath) as pool:
+                results.append(pool.submit(benchmark_size, n_vehicles, horizon, resets, repeats=repeats).result())
+    finally:
+        if cacheDir is None:
+            os.environ.pop('BEVPRO_CACHE_DIR', None)
+        else:
+            os.environ['BEVPRO_CACHE_DIR'] = cacheDir
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'horizon': horizon,
+        'cold_cache': cold_cache,
+        'results': results,
+    }
+
+
+def compare(report, baseline, max_slowdown=0.2):
+    '''Compare the results with a baseline report of the same fleet sizes
+    The slowdown is the relative increase of the times, or the relative decrease of the throughput,
+    a metric fails when its slowdown is beyond max_slowdown and its difference is beyond the margin of COMPARED_METRICS
+    ------------------------------------
+    Output
+        -- list of (n_vehicles, metric, baseline value, value, slowdown, failed)
+    '''
+    baselineResults = {result['n_vehicles']: result for result in baseline['results']}
+    rows = []
+    for result in report['results']:
+        baseResult = baselineResults.get(result['n_vehicles'])
+        if baseResult is None:
+            continue
+        for metric, (largerIsBetter, margin) in COMPARED_METRICS.items():
+            value, baseValue = result[metric], baseResult[metric]
+            slowdown = baseValue/value-1 if largerIsBetter else value/baseValue-1
+            difference = baseValue-value if largerIsBetter else value-baseValue
+            rows.append((result['n_vehicles'], metric, baseValue, value, slowdown, slowdown > max_slowdown and difference > margin))
+    return rows
+
+
+def _setPath():
+    '''Worker initializer, the models are imported by their module names like in the notebook
+    '''
+    envDir = os.path.dirname(os.path.abspath(__file__))
+    if envDir not in sys.path:
+        sys.path.insert(0, envDir)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark BEVCommunity over fleet sizes')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES), help='numbers of vehicles')
+    parser.add_argument('--horizon', type=int, default=8760, help='number of hours of the benchmarked episode')
+    parser.add_argument('--resets', type=int, default=20, help='number of reset() calls for the reset latency')
+    parser.add_argument('--repeats', type=int, default=5, help='number of runs of each timing, the best is kept')
+    parser.add_argument('--cold-cache', action='store_true', help='parse every input file in the constructor')
+    parser.add_argument('--output', default=None, help='json file of the results, default standard output')
+    parser.add_argument('--baseline', default=None, help='json file of the baseline results to compare with')
+    parser.add_argument('--max-slowdown', type=float, default=0.2, help='relative slowdown over the baseline that fails the run')
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.sizes, args.horizon, args.resets, args.cold_cache, args.repeats)
+    for result in report['results']:
+        print('{n_vehicles:>7} vehicles: constructor {constructor_s:.3f} s, reset {reset_ms:.3f} ms, '
+              '{steps_per_s:.0f} steps/s, peak RSS {peak_rss_mb} MB'.format(**result), file=sys.stderr)
+
+    failed = False
+    if args.baseline is not None:
+        with open(args.baseline) as baselineFile:
+            baseline = json.load(baselineFile)
+        report['comparison'] = []
+        for n_vehicles, metric, baseValue, value, slowdown, metricFailed in compare(report, baseline, args.max_slowdown):
+            report['comparison'].append({'n_vehicles': n_vehicles, 'metric': metric, 'baseline': baseValue,
+                                         'value': value, 'slowdown': slowdown, 'failed': metricFailed})
+            if metricFailed:
+                failed = True
+                print('{:>7} vehicles: {} slowed down by {:.1%} ({:.4g} -> {:.4g})'.format(
+                    n_vehicles, metric, slowdown, baseValue, value), file=sys.stderr)
+        report['failed'] = failed
+
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, 'w') as outputFile:
+            json.dump(report, outputFile, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,161 @@
+import collections
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+
+'''
+Content-addressed cache of the parsed input files
+1. Entries are keyed by the hash of the file content, so an edited file is parsed again and a copied file is not
+2. Profiles are stored as .npy files and memory-mapped, records (vehicle parameters, parking schedules) as .json files
+3. The cache directory is kept under max_bytes by removing the least recently used entries, only the files written by
+   the cache are removed, other files of the directory are left untouched
+4. Up to max_entries entries are also kept in memory, so identical files share one object in the process
+'''
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'bevpro')
+DEFAULT_MAX_BYTES = 1 << 30
+DEFAULT_MAX_ENTRIES = 256
+# Names of the cache files: kind, content hash, parsing settings
+ENTRY_PATTERN = re.compile(r'^(array|record)-[0-9a-f]{40}.*\.(npy|json)$')
+
+
+class ProfileCache:
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, max_entries=DEFAULT_MAX_ENTRIES):
+        '''Cache of the parsed input files
+        ------------------------------------
+        Args
+            -- cache_dir, directory of the cache files, None to keep the entries in memory only
+            -- max_bytes, size cap of the cache directory, unit: byte
+            -- max_entries, number of entries kept in memory, the least recently used ones are dropped beyond it
+        ------------------------------------
+        '''
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._hashes = {}                           # (path, mtime, size) -> content hash
+        self._memory = collections.OrderedDict()    # cache key -> parsed object, in order of use
+        if self.cache_dir is not None:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+            except OSError:
+                # Fall back to the in-memory cache when the directory can not be created
+                self.cache_dir = None
+
+    def fileHash(self, csv_file):
+        '''Hash of the file content, memorized as long as the file is not modified
+        '''
+        path = os.path.abspath(csv_file)
+        stat = os.stat(path)
+        statKey = (path, stat.st_mtime_ns, stat.st_size)
+        if statKey not in self._hashes:
+            with open(path, 'rb') as file:
+                self._hashes[statKey] = hashlib.sha1(file.read()).hexdigest()
+        return self._hashes[statKey]
+
+    def getArray(self, csv_file, loader, *keyParts):
+        '''Get the array parsed from the file, loader(csv_file) is only called on a cache miss
+        keyParts are the parsing settings other than the file content, e.g. step length and year
+        The returned array is read-only
+        '''
+        key = '-'.join(['array', self.fileHash(csv_file)] + [str(part) for part in keyParts])
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return self._memory[key]
+        path = self._path(key, '.npy')
+        if path is not None and os.path.exists(path):
+            os.utime(path)
+            array = np.load(path, mmap_mode='r')
+        else:
+            array = np.ascontiguousarray(loader(csv_file))
+            if path is not None:
+                self._write(path, lambda file: np.save(file, array))
+                array = np.load(path, mmap_mode='r')
+            array.setflags(write=False)
+        self._remember(key, array)
+        return array
+
+    def getRecord(self, csv_file, loader, build=None):
+        '''Get the json-compatible record parsed from the file, loader(csv_file) is only called on a cache miss
+        build(record) converts the record to the returned object, which is shared by all callers
+        '''
+        key = '-'.join(['record', self.fileHash(csv_file)])
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return self._memory[key]
+        path = self._path(key, '.json')
+        if path is not None and os.path.exists(path):
+            os.utime(path)
+            with open(path) as file:
+                record = json.load(file)
+        else:
+            record = loader(csv_file)
+            if path is not None:
+                self._write(path, lambda file: file.write(json.dumps(record).encode()))
+        obj = record if build is None else build(record)
+        self._remember(key, obj)
+        return obj
+
+    def clearMemory(self):
+        '''Remove the entries kept in memory, the files of the cache directory are kept
+        '''
+        self._memory.clear()
+        self._hashes.clear()
+
+    def clear(self):
+        '''Remove all entries from memory and disk, the other files of the cache directory are kept
+        '''
+        self.clearMemory()
+        if self.cache_dir is not None:
+            for name in os.listdir(self.cache_dir):
+                if ENTRY_PATTERN.match(name):
+                    os.remove(os.path.join(self.cache_dir, name))
+
+    def _remember(self, key, obj):
+        self._memory[key] = obj
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _path(self, key, suffix):
+        if self.cache_dir is None:
+            return None
+        return os.path.join(self.cache_dir, key+suffix)
+
+    def _write(self, path, writer):
+        '''Write a cache file atomically, then evict the least recently used files beyond the size cap
+        '''
+        tmpPath = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmpPath, 'wb') as file:
+            writer(file)
+        os.replace(tmpPath, path)
+        self._evict(keep=os.path.basename(path))
+
+    def _evict(self, keep=None):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not ENTRY_PATTERN.match(name) or name == keep:
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, name))
+        totalBytes = sum(entry[1] for entry in entries)
+        if keep is not None:
+            totalBytes += os.stat(os.path.join(self.cache_dir, keep)).st_size
+        for _, size, name in sorted(entries):
+            if totalBytes <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+            totalBytes -= size
+
+
+# Cache used by the models, the directory can be set with the BEVPRO_CACHE_DIR environment variable,
+# an empty BEVPRO_CACHE_DIR keeps the entries in memory only
+profileCache = ProfileCache(os.environ.get('BEVPRO_CACHE_DIR', DEFAULT_CACHE_DIR) or None)
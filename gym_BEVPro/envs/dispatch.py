@@ -0,0 +1,229 @@
+import numpy as np
+from scipy import sparse
+from scipy.optimize import linprog
+
+'''
+Optimal charging and onsite-battery dispatch of BEVCommunity as a sparse linear program
+1. A relaxed benchmark of the grid load of a configured environment, to compare the charging policies with
+2. The vehicles with the same parameters, parking schedules and travel distance distributions are aggregated into one group
+   sharing their stored electricity and the sum of their travel distances, so thousands of vehicles of a few types make a small
+   problem whatever the drawn distances. With exact_groups the battery volume and the travel distances are also part of the group,
+   which gives the same optimum as the vehicles one by one, as all the constraints are linear
+3. Constraints, per time step:
+    -- vehicles charge and discharge only when parked, within their charging/discharging capacities and efficiencies
+    -- the battery volume of the vehicles stays within [0, batteryCapacity], with the cruise consumption at the return hour
+    -- the charging power over the maximum charging capacity of each vehicle is at most plantNum, i.e. the charger limit
+       relaxed to fractional chargers
+    -- the onsite battery charges from the renewable surplus of the buildings only, and discharges at most the building load
+       and the vehicle charging, within its capacities and efficiencies
+   the onsite battery is dispatched optimally, while step() follows its charge/discharge rule, so the optimum is a benchmark
+   rather than a bound of step(). With exact_groups the vehicle schedule is replayed exactly by step() as long as the chargers
+   are not short, only the onsite battery then differs
+4. The horizon is solved in one problem, or in rolling windows of a committed part and a lookahead,
+   the constraint matrices are built once per window length and reused by the following windows
+'''
+
+OBJECTIVES = ('import', 'peak', 'net')
+
+
+class DispatchLP:
+
+    def __init__(self, env, objective='import', exact_groups=False):
+        '''Dispatch problem of a BEVCommunity environment from its current time step and state
+        ------------------------------------
+        Args
+            -- env, BEVCommunity environment
+            -- objective, 'import' for the total grid import energy, 'peak' for the peak grid import power,
+               'net' for the net grid energy (import minus export)
+            -- exact_groups, only group the vehicles of the same battery volume and travel distances, so the actions are
+               replayable by step(), otherwise the vehicles of a group share their stored electricity, a relaxation with fewer groups
+        ------------------------------------
+        '''
+        assert objective in OBJECTIVES, "The objective needs to be one of {}".format(OBJECTIVES)
+        self.env = env = env.unwrapped
+        self.objective = objective
+        self.step_h = env.stepLenth/3600
+        self.plantNum = env.plantNum
+        self.battery = env.batteryOnsite
+        fleet = env.fleet
+
+        # Group the vehicles of the same type and distance distribution, the travel distances of a group are summed
+        keys = [fleet.cruiseEff, fleet.maxChargingCapacity, fleet.maxDischargingCapacity, fleet.charEff, fleet.discEff, fleet.batteryCapacity,
+                fleet.schdId_wd, fleet.schdId_nwd, fleet.dist_mu_wd, fleet.dist_sigma_wd, fleet.dist_mu_nwd, fleet.dist_sigma_nwd]
+        if exact_groups:
+            keys += [fleet.batteryVol] + ([] if env.distances is None else list(env.distances))
+        _, groupIdx, self.vehicleGroup = np.unique(np.column_stack(keys), axis=0, return_index=True, return_inverse=True)
+        self.vehicleGroup = self.vehicleGroup.ravel()
+        self.groupIdx = groupIdx                                   # one vehicle of each group
+        self.groupSize = np.bincount(self.vehicleGroup).astype(float)
+        self.groupNum = len(groupIdx)
+        self.groups = [np.flatnonzero(self.vehicleGroup == group_i) for group_i in range(self.groupNum)]
+        # Indicator matrix (n_vehicles, n_groups) of the groups
+        self.groupMatrix = sparse.csr_matrix((np.ones(fleet.vehicleNum), (np.arange(fleet.vehicleNum), self.vehicleGroup)),
+                                             shape=(fleet.vehicleNum, self.groupNum))
+        self._matrices = {}
+
+    def solve(self, steps=None, window=None, lookahead=24, terminal=True, options=None):
+        '''Solve the dispatch from the current time step of the environment, the environment itself is not changed
+        ------------------------------------
+        Args
+            -- steps, number of time steps to schedule, default until the end of the horizon
+            -- window, number of committed time steps of each rolling window, None to solve all steps in one problem
+            -- lookahead, number of time steps solved beyond the committed steps of each window
+            -- terminal, the vehicles and the onsite battery end the scheduled steps with at least their initial volumes,
+               so the optimum does not come from emptying them
+            -- options, options of scipy.optimize.linprog with the HiGHS method
+        ------------------------------------
+        Output
+            -- dict of arrays over the scheduled steps: gridLoad, power_batteryCharge, power_batteryDischarge, batteryVol,
+               totalVehicleCharge, totalVehicletoGrid, groupPower (n_steps, n_groups) the net charging power of each group,
+               groupVol (n_steps, n_groups) the battery volume of each group, and the objective value
+        '''
+        env = self.env
+        start = env.time_step_idx
+        steps = env.n_steps-start if steps is None else steps
+        window = steps if window is None else window
+        groupNum = self.groupNum
+        results = {name: np.empty(steps) for name in
+                   ['gridLoad', 'power_batteryCharge', 'power_batteryDischarge', 'batteryVol', 'totalVehicleCharge', 'totalVehicletoGrid']}
+        results['groupPower'] = np.empty((steps, groupNum))
+        results['groupVol'] = np.empty((steps, groupNum))
+
+        groupVol = np.bincount(self.vehicleGroup, weights=env.fleet.batteryVol, minlength=groupNum)
+        batteryVol = float(self.battery.batteryVol)
+        finalVol = (groupVol, batteryVol) if terminal else None
+        for windowStart in range(0, steps, window):
+            committed = min(window, steps-windowStart)
+            length = min(committed+lookahead, steps-windowStart) if window < steps else committed
+            final = windowStart+length == steps
+            solution = self._solveWindow(start+windowStart, length, groupVol, batteryVol, finalVol if final else None, options)
+            for name, values in solution.items():
+                results[name][windowStart:windowStart+committed] = values[:committed]
+            groupVol = solution['groupVol'][committed-1]
+            batteryVol = solution['batteryVol'][committed-1]
+
+        gridLoad = results['gridLoad']
+        if self.objective == 'import':
+            results['objective'] = np.maximum(gridLoad, 0).sum()*self.step_h
+        elif self.objective == 'peak':
+            results['objective'] = max(gridLoad.max(), 0)
+        else:
+            results['objective'] = gridLoad.sum()*self.step_h
+        return results
+
+    def actions(self, results, steps=slice(None)):
+        '''Action array (n_steps, n_vehicles) of the solved schedule over the given steps, the power of a group split evenly
+        '''
+        groupPower = results['groupPower'][steps]
+        return groupPower[:, self.vehicleGroup]/self.groupSize[self.vehicleGroup]
+
+    def _solveWindow(self, start, length, groupVol, batteryVol, finalVol, options):
+        '''Solve the steps [start, start+length) from the given group and onsite battery volumes
+        finalVol is None, or the minimum (group volumes, onsite battery volume) at the last step
+        '''
+        env, fleet, battery = self.env, self.env.fleet, self.battery
+        groupNum, step_h = self.groupNum, self.step_h
+        size = self.groupSize
+        idx = self.groupIdx
+        steps = np.arange(start, start+length)
+        netLoad = np.asarray(env.buildingLoad[steps]) - 0.95*np.asarray(env.reGeneration[steps])
+
+        # Parking state and cruise consumption of each group at each time step
+        dayType = env.stepDayType[steps]
+        park, _, cruiseMask = fleet.getStateStatic(dayType, env.stepHour[steps])
+        park, cruiseMask = park[:, idx], cruiseMask[:, idx] & env.stepHourStart[steps][:, None]
+        if env.distances is not None:
+            distance = np.asarray((self.groupMatrix.T @ env.distances[steps*env.stepLenth//86400].T).T)
+        else:
+            distance = np.where(dayType[:, None] == 1, fleet.dist_mu_wd[idx], fleet.dist_mu_nwd[idx])*size
+        consumption = np.where(cruiseMask, fleet.cruiseEff[idx]*distance, 0)
+
+        # Variables: c, d, e (length, groupNum) each, then bc, bd, b (length,) and the import variables
+        A_eq, A_ub, n_var = self._getMatrices(length)
+        n_veh = length*groupNum
+        b_eq = np.concatenate([-consumption.ravel(), np.zeros(length)])
+        b_eq[:groupNum] += groupVol
+        b_eq[n_veh] += batteryVol
+        b_ub = np.concatenate([np.full(length, float(self.plantNum)), np.maximum(netLoad, 0), -netLoad])
+
+        lower = np.zeros(n_var)
+        upper = np.full(n_var, np.inf)
+        upper[:n_veh] = (park*fleet.maxChargingCapacity[idx]*size).ravel()
+        upper[n_veh:2*n_veh] = (park*fleet.maxDischargingCapacity[idx]*size).ravel()
+        upper[2*n_veh:3*n_veh] = (fleet.batteryCapacity[idx]*size - consumption).ravel()
+        upper[3*n_veh:3*n_veh+length] = np.minimum(battery.charCap, np.maximum(-netLoad, 0))
+        upper[3*n_veh+length:3*n_veh+2*length] = battery.discCap
+        upper[3*n_veh+2*length:3*n_veh+3*length] = battery.capacityMax
+        if finalVol is not None:
+            lower[3*n_veh-groupNum:3*n_veh] = np.minimum(finalVol[0], upper[3*n_veh-groupNum:3*n_veh])
+            lower[3*n_veh+3*length-1] = min(finalVol[1], battery.capacityMax)
+        if self.objective == 'net':
+            # The import variables are free and equal to the grid load
+            lower[3*n_veh+3*length:] = -np.inf
+
+        cost = np.zeros(n_var)
+        if self.objective == 'peak':
+            cost[-1] = 1
+        else:
+            cost[3*n_veh+3*length:] = step_h
+        solution = linprog(cost, A_ub=A_ub, b_ub=b_ub, A_eq=A_eq, b_eq=b_eq, bounds=np.column_stack([lower, upper]),
+                           method='highs', options=options)
+        if solution.status != 0:
+            raise RuntimeError("The dispatch problem of steps {} to {} is not solved: {}".format(start, start+length, solution.message))
+
+        x = solution.x
+        charge = x[:n_veh].reshape(length, groupNum)
+        discharge = x[n_veh:2*n_veh].reshape(length, groupNum)
+        power_batteryCharge = x[3*n_veh:3*n_veh+length]
+        power_batteryDischarge = x[3*n_veh+length:3*n_veh+2*length]
+        totalVehicleCharge = charge.sum(axis=1)
+        totalVehicletoGrid = discharge.sum(axis=1)
+        return {
+            'gridLoad': netLoad + power_batteryCharge - power_batteryDischarge + totalVehicleCharge - totalVehicletoGrid,
+            'power_batteryCharge': power_batteryCharge,
+            'power_batteryDischarge': power_batteryDischarge,
+            'batteryVol': x[3*n_veh+2*length:3*n_veh+3*length],
+            'totalVehicleCharge': totalVehicleCharge,
+            'totalVehicletoGrid': totalVehicletoGrid,
+            'groupPower': charge - discharge,
+            'groupVol': x[2*n_veh:3*n_veh].reshape(length, groupNum),
+        }
+
+    def _getMatrices(self, length):
+        '''Constraint matrices of a window of the given length, only the bounds and right-hand sides change between windows
+        Equalities: the battery volume balance of each group and of the onsite battery
+        Inequalities: the charger limit, the onsite battery discharge, and the import (or peak) definition
+        '''
+        if length in self._matrices:
+            return self._matrices[length]
+        fleet, battery = self.env.fleet, self.battery
+        groupNum, step_h = self.groupNum, self.step_h
+        idx = self.groupIdx
+        n_veh = length*groupNum
+        n_import = 1 if self.objective == 'peak' else length
+        n_var = 3*n_veh + 3*length + n_import
+        eye_veh = sparse.identity(n_veh, format='csr')
+        # e[t] - e[t-1], the volume before the first step is on the right-hand side
+        diff_veh = eye_veh - sparse.eye(n_veh, k=-groupNum, format='csr')
+        diff_bat = sparse.identity(length, format='csr') - sparse.eye(length, k=-1, format='csr')
+        charEff = np.tile(fleet.charEff[idx], length)
+        discEff = np.tile(fleet.discEff[idx], length)
+
+        vehicleBalance = sparse.hstack([sparse.diags(-charEff*step_h), sparse.diags(step_h/discEff), diff_veh,
+                                        sparse.csr_matrix((n_veh, 3*length + n_import))])
+        batteryBalance = sparse.hstack([sparse.csr_matrix((length, 3*n_veh)), sparse.identity(length)*(-battery.charEff*step_h),
+                                        sparse.identity(length)*(step_h/battery.discEff), diff_bat, sparse.csr_matrix((length, n_import))])
+        A_eq = sparse.vstack([vehicleBalance, batteryBalance], format='csr')
+
+        # Sum over the groups of each time step
+        groupSum = sparse.kron(sparse.identity(length), np.ones((1, groupNum)), format='csr')
+        chargerUse = sparse.kron(sparse.identity(length), 1/fleet.maxChargingCapacity[idx][None, :], format='csr')
+        chargerLimit = sparse.hstack([chargerUse, sparse.csr_matrix((length, 2*n_veh + 3*length + n_import))])
+        batteryCover = sparse.hstack([-groupSum, sparse.csr_matrix((length, 2*n_veh + length)), sparse.identity(length),
+                                      sparse.csr_matrix((length, length + n_import))])
+        importVariable = -sparse.identity(length) if n_import == length else sparse.csr_matrix(-np.ones((length, 1)))
+        gridImport = sparse.hstack([groupSum, -groupSum, sparse.csr_matrix((length, n_veh)), sparse.identity(length), -sparse.identity(length),
+                                    sparse.csr_matrix((length, length)), importVariable])
+        A_ub = sparse.vstack([chargerLimit, batteryCover, gridImport], format='csr')
+        self._matrices[length] = (A_eq, A_ub, n_var)
+        return self._matrices[length]
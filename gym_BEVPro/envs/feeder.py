@@ -0,0 +1,283 @@
+import multiprocessing
+import time
+from multiprocessing import shared_memory
+
+import gym
+from gym import spaces
+import numpy as np
+
+from BEVCommunity import BEVCommunity
+
+'''
+Feeder of many BEVCommunity communities behind one transformer
+1. The communities are partitioned across worker processes, which step them in parallel
+2. Actions, states and grid loads are exchanged through shared memory, the pipes to the workers only carry the commands
+3. The grid loads of the communities are aggregated at each step, when the feeder load is beyond the import (export) limit
+   of the transformer, the communities are stepped again from their saved state with the EV charging (discharging) curtailed
+   by a common factor, the largest one that meets the limit
+4. The time spent in synchronization, i.e. the step time beyond the slowest worker, is measured and reported by syncStats()
+'''
+
+COMMENT_NUM = 4
+FEEDER_OBS_NAMES = ['feeder_gridLoad', 'feeder_chargeScale', 'feeder_dischargeScale']
+
+
+class BEVFeeder(gym.Env):
+
+    def __init__(self, communities, import_limit=None, export_limit=None, n_workers=None, seed=None, max_curtail_iter=8, curtail_tol=0.1):
+        '''
+        Args:
+            -- communities: list of dicts of the BEVCommunity arguments of each community, building_list, re_list,
+               vehicle_list, battery_info, powerplant_num and optionally the other keyword arguments, the same horizon for all
+            -- import_limit, export_limit: transformer limits of the feeder import and export power, None for no limit, unit: kW
+            -- n_workers: number of worker processes, default os.cpu_count() and at most one per community
+            -- seed: seed of the travel distance scenarios of the communities, drawn at each reset, see BEVCommunity.reset
+            -- max_curtail_iter: maximum number of curtailed re-steps per step to find the largest curtailment factor within the limits
+            -- curtail_tol: the search of the curtailment factor stops once the feeder load is within curtail_tol of the limit, unit: kW
+        '''
+        super().__init__()
+        self.import_limit = import_limit
+        self.export_limit = export_limit
+        self.max_curtail_iter = max_curtail_iter
+        self.curtail_tol = curtail_tol
+        self.community_n = len(communities)
+        n_workers = min(n_workers or multiprocessing.cpu_count(), self.community_n)
+
+        # Vehicles and state sizes of each community, in the order of the feeder action and state arrays
+        self.vehicle_nums = np.array([sum(number for _, number in community['vehicle_list'][1:]) for community in communities])
+        self.actionOffsets = np.concatenate([[0], np.cumsum(self.vehicle_nums)])
+        self.obsOffsets = len(FEEDER_OBS_NAMES) + np.concatenate([[0], np.cumsum(4+3*self.vehicle_nums)])
+        horizons = {community.get('horizon', 8760)*3600//community.get('stepLenth', 3600) for community in communities}
+        assert len(horizons) == 1, "All communities need the same number of time steps."
+        self.n_steps = horizons.pop()
+        self.time_step_idx = 0
+
+        # Shared arrays: actions, states, and per community the grid load and the comments
+        self._blocks = []
+        self.actionBuf = self._sharedArray((self.actionOffsets[-1],), np.float64)
+        self.obsBuf = self._sharedArray((self.obsOffsets[-1],), np.float32)
+        self.resultBuf = self._sharedArray((self.community_n, 1+COMMENT_NUM), np.float64)
+
+        # Partition the communities across the workers, the largest first to the least loaded worker
+        self.partitions = [[] for _ in range(n_workers)]
+        loads = np.zeros(n_workers)
+        for community_i in np.argsort(-self.vehicle_nums, kind='stable'):
+            worker_i = int(np.argmin(loads))
+            self.partitions[worker_i].append(int(community_i))
+            loads[worker_i] += 1 + self.vehicle_nums[community_i]
+
+        seeds = np.random.SeedSequence(seed).spawn(self.community_n)
+        layout = {'actionOffsets': self.actionOffsets, 'obsOffsets': self.obsOffsets, 'community_n': self.community_n,
+                  'blocks': [block.name for block in self._blocks], 'saveState': import_limit is not None or export_limit is not None}
+        self._pipes, self._workers = [], []
+        for partition in self.partitions:
+            parentConn, workerConn = multiprocessing.Pipe()
+            worker = multiprocessing.Process(target=_feederWorker, daemon=True,
+                                             args=(workerConn, partition, [communities[idx] for idx in partition], [seeds[idx] for idx in partition], layout))
+            worker.start()
+            workerConn.close()
+            self._pipes.append(parentConn)
+            self._workers.append(worker)
+        self._command(('ready',))
+
+        self.action_names = ['community_{}_vehicle_{}'.format(community_i, vehicle_i)
+                             for community_i, vehicle_num in enumerate(self.vehicle_nums) for vehicle_i in range(vehicle_num)]
+        self.action_space = spaces.Box(low=-100, high=100, shape=(len(self.action_names),), dtype=np.float32)
+        self.obs_names = FEEDER_OBS_NAMES + ['community_{}_{}'.format(community_i, name) for community_i, vehicle_num in enumerate(self.vehicle_nums)
+                                             for name in ['buildingLoad', 'reGeneration', 'battery_left', 'battery_spare'] +
+                                             ['vehicle_park_{}'.format(vehicle_i) for vehicle_i in range(vehicle_num)] +
+                                             ['vehicle_max_dist_{}'.format(vehicle_i) for vehicle_i in range(vehicle_num)] +
+                                             ['vehicle_SOC_{}'.format(vehicle_i) for vehicle_i in range(vehicle_num)]]
+        self.observation_space = spaces.Box(low=-np.inf, high=np.inf, shape=(len(self.obs_names),), dtype=np.float32)
+        self._syncStats = dict.fromkeys(['steps', 'stepTime', 'workerTime', 'syncTime', 'resteps', 'limitViolations'], 0)
+
+    def communityObs(self, obs, community_i):
+        '''State array of one community in a feeder state array
+        '''
+        return obs[self.obsOffsets[community_i]:self.obsOffsets[community_i+1]]
+
+    def reset(self):
+        self.time_step_idx = 0
+        self._command(('reset',))
+        self.obsBuf[:len(FEEDER_OBS_NAMES)] = 0, 1, 1
+        return self.obsBuf.copy()
+
+    def step(self, actions):
+        startTime = time.perf_counter()
+        self.actionBuf[:] = actions
+        workerTime = max(self._command(('step',)))
+        gridLoads = self.resultBuf[:, 0]
+        feederLoad = gridLoads.sum()
+
+        # Curtail the EV charging (discharging) of all communities by the largest common factor within the limits
+        scales = {'charge': 1.0, 'discharge': 1.0}
+        if self.import_limit is not None and feederLoad > self.import_limit:
+            feederLoad, curtailTime = self._curtail(scales, 'charge', feederLoad, self.import_limit, self.resultBuf[:, 3].sum())
+            workerTime += curtailTime
+        elif self.export_limit is not None and feederLoad < -self.export_limit:
+            feederLoad, curtailTime = self._curtail(scales, 'discharge', feederLoad, -self.export_limit, self.resultBuf[:, 4].sum())
+            workerTime += curtailTime
+        chargeScale, dischargeScale = scales['charge'], scales['discharge']
+
+        self.time_step_idx += 1
+        done = self.time_step_idx == self.n_steps
+        self.obsBuf[:len(FEEDER_OBS_NAMES)] = feederLoad, chargeScale, dischargeScale
+        comments = {'community_gridLoad': gridLoads.copy(), 'community_comments': self.resultBuf[:, 1:].copy(),
+                    'chargeScale': chargeScale, 'dischargeScale': dischargeScale}
+
+        stepTime = time.perf_counter()-startTime
+        self._syncStats['steps'] += 1
+        self._syncStats['stepTime'] += stepTime
+        self._syncStats['workerTime'] += workerTime
+        self._syncStats['syncTime'] += stepTime-workerTime
+        return self.obsBuf.copy(), feederLoad, done, comments
+
+    def _curtail(self, scales, name, feederLoad, limit, vehiclePower):
+        '''Find the largest scale in [0, 1] of the vehicle charging ('charge') or discharging ('discharge') power
+        that brings the feeder load within the limit, and re-step the communities with it
+        The excess over the limit grows with the scale, the scale is searched by false position within a bracket
+        [feasible scale, infeasible scale], starting from the excess of a load proportional to the vehicle power
+        Return: the feeder load and the compute time of the re-steps
+        '''
+        sign = 1 if name == 'charge' else -1
+        workerTime = 0
+
+        def excessAt(scale):
+            nonlocal workerTime
+            scales[name] = scale
+            workerTime += max(self._command(('restep', scales['charge'], scales['discharge'])))
+            self._syncStats['resteps'] += 1
+            return sign*(self.resultBuf[:, 0].sum()-limit)
+
+        # Loads within round-off of the limit are feasible
+        margin = 1e-9*max(abs(limit), 1)
+        high, highExcess = 1.0, sign*(feederLoad-limit)
+        low, lowExcess = 0.0, None
+        scale = max(1 - highExcess/vehiclePower, 0) if vehiclePower > 0 else 0.0
+        for _ in range(self.max_curtail_iter):
+            excess = excessAt(scale)
+            if excess > margin:
+                preHigh, preHighExcess = high, highExcess
+                high, highExcess = scale, excess
+                if scale == 0:
+                    break
+            else:
+                low, lowExcess = scale, excess
+                if excess >= -self.curtail_tol:
+                    break
+            if lowExcess is None:
+                # Secant through the two lowest infeasible scales, or no vehicle power
+                slope = (preHighExcess-highExcess)/(preHigh-high)
+                scale = max(high - 1.01*highExcess/slope, 0) if slope > 0 else 0.0
+            else:
+                scale = low + (high-low)*(-lowExcess)/(highExcess-lowExcess)
+                # Bisect when false position stalls at one end of the bracket
+                if not low+0.01*(high-low) < scale < high-0.01*(high-low):
+                    scale = (low+high)/2
+                if high-low < 1e-9:
+                    break
+
+        # Keep the largest feasible scale found, or no vehicle power when none is found within the iterations
+        if high > 0 and scales[name] != low and excessAt(low) > margin:
+            high = 0
+        if high == 0:
+            # Not even without vehicle power is the load within the limit
+            self._syncStats['limitViolations'] += 1
+        return self.resultBuf[:, 0].sum(), workerTime
+
+    def syncStats(self):
+        '''Mean step time, time of the slowest worker and synchronization time per step, unit: s,
+        with the numbers of curtailed re-steps and of steps beyond the transformer limits
+        '''
+        stats = dict(self._syncStats)
+        steps = max(stats['steps'], 1)
+        for name in ['stepTime', 'workerTime', 'syncTime']:
+            stats[name] /= steps
+        return stats
+
+    def close(self):
+        if not self._workers:
+            return
+        for conn in self._pipes:
+            try:
+                conn.send(('close',))
+            except (BrokenPipeError, OSError):
+                pass
+        for worker in self._workers:
+            worker.join(timeout=5)
+        self._workers, self._pipes = [], []
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+    def _command(self, command):
+        '''Send a command to all workers and wait for them, return the compute time of each worker
+        '''
+        for conn in self._pipes:
+            conn.send(command)
+        replies = [conn.recv() for conn in self._pipes]
+        for reply in replies:
+            if isinstance(reply, str):
+                self.close()
+                raise RuntimeError("Feeder worker failed: {}".format(reply))
+        return replies
+
+    def _sharedArray(self, shape, dtype):
+        block = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape))*np.dtype(dtype).itemsize, 1))
+        self._blocks.append(block)
+        array = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        array[:] = 0
+        return array
+
+
+def _feederWorker(conn, partition, communities, seeds, layout):
+    '''Worker process stepping a partition of the communities of a feeder
+    Replies to each command with its compute time, or with the error message as a string
+    '''
+    try:
+        blocks = [shared_memory.SharedMemory(name=name) for name in layout['blocks']]
+        actionOffsets, obsOffsets = layout['actionOffsets'], layout['obsOffsets']
+        actionBuf = np.ndarray((actionOffsets[-1],), dtype=np.float64, buffer=blocks[0].buf)
+        obsBuf = np.ndarray((obsOffsets[-1],), dtype=np.float32, buffer=blocks[1].buf)
+        resultBuf = np.ndarray((layout['community_n'], 1+COMMENT_NUM), dtype=np.float64, buffer=blocks[2].buf)
+        envs = [BEVCommunity(reuse_obs=True, **community) for community in communities]
+        for env, seed in zip(envs, seeds):
+            env.seed(seed)
+        states = [env.get_state(include_rng=False) for env in envs]
+    except Exception as exception:
+        conn.send(repr(exception))
+        return
+
+    def stepAll(chargeScale=1.0, dischargeScale=1.0, restore=False):
+        for env, community_i, state in zip(envs, partition, states):
+            actions = actionBuf[actionOffsets[community_i]:actionOffsets[community_i+1]]
+            if restore:
+                env.set_state(state)
+                actions = np.where(actions > 0, actions*chargeScale, actions*dischargeScale)
+            elif layout['saveState']:
+                env.get_state(include_rng=False, out=state)
+            obs, reward, done, comments = env.step(actions)
+            obsBuf[obsOffsets[community_i]:obsOffsets[community_i+1]] = obs
+            resultBuf[community_i, 0] = reward
+            resultBuf[community_i, 1:] = comments
+
+    while True:
+        command = conn.recv()
+        startTime = time.perf_counter()
+        try:
+            if command[0] == 'close':
+                break
+            elif command[0] == 'reset':
+                for env, community_i in zip(envs, partition):
+                    obsBuf[obsOffsets[community_i]:obsOffsets[community_i+1]] = env.reset()
+            elif command[0] == 'step':
+                stepAll()
+            elif command[0] == 'restep':
+                stepAll(command[1], command[2], restore=True)
+        except Exception as exception:
+            conn.send(repr(exception))
+            continue
+        conn.send(time.perf_counter()-startTime)
+    for block in blocks:
+        block.close()
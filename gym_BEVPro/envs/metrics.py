@@ -0,0 +1,206 @@
+from collections import deque
+
+import gym
+import numpy as np
+
+'''
+Streaming key performance indicators of BEVCommunity
+1. The indicators follow the formulas of the result section of Simulation.ipynb
+2. Each step updates running sums in O(1), so no history is kept
+3. Hour-of-day profiles and indicators over a rolling window of the last steps are also provided
+'''
+
+# Default carbon factors of Simulation.ipynb
+CARBON_FAC_ELE = 0.386          # kg CO2 per kWh of grid electricity
+CARBON_FAC_GAS = 18.74          # kg CO2 per gallon of gasoline for vehicles
+GASOLINE_EFF = 25.7 * 1.609     # km per gallon of gasoline for normal vehicle transportation
+VEHICLE_EFF = 0.15              # kWh per km for transportation
+
+
+class _RunningSum:
+    '''Compensated (Neumaier) running sum, accurate to the last digits over long runs
+    '''
+
+    def __init__(self):
+        self.total = 0.0
+        self.compensation = 0.0
+
+    def add(self, value):
+        total = self.total + value
+        if abs(self.total) >= abs(value):
+            self.compensation += (self.total - total) + value
+        else:
+            self.compensation += (value - total) + self.total
+        self.total = total
+
+    @property
+    def value(self):
+        return self.total + self.compensation
+
+
+class KPIAccumulator:
+
+    def __init__(self, step_h=1, carbonFac_ele=CARBON_FAC_ELE, carbonFac_gas=CARBON_FAC_GAS,
+                 gasolineEff=GASOLINE_EFF, vehicleEff=VEHICLE_EFF, window=24):
+        '''Running indicators of energy independence, carbon emission and grid import/export
+        ------------------------------------
+        Args
+            -- step_h, length of time step, unit: h
+            -- carbonFac_ele, kg CO2 per kWh of grid electricity
+            -- carbonFac_gas, kg CO2 per gallon of gasoline for vehicles
+            -- gasolineEff, km per gallon of gasoline for normal vehicle transportation
+            -- vehicleEff, kWh per km of the electric vehicles
+            -- window, number of steps of the rolling window
+        ------------------------------------
+        '''
+        self.step_h = step_h
+        self.carbonFac_ele = carbonFac_ele
+        self.carbonFac_gas = carbonFac_gas
+        self.gasolineEff = gasolineEff
+        self.vehicleEff = vehicleEff
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        self.steps = 0
+        self.gridSum = _RunningSum()
+        self.importSum = _RunningSum()
+        self.exportSum = _RunningSum()
+        self.importCount = 0
+        self.exportCount = 0
+        self.buildingSum = _RunningSum()
+        self.vehicleChargeSum = _RunningSum()
+        # Hour-of-day sums of building load, renewable generation and grid load
+        self.hourCount = np.zeros(24, dtype=np.int64)
+        self.hourSums = np.zeros((3, 24))
+        # Rolling window of (grid load, building load, vehicle charge)
+        self._windowValues = deque()
+        self._windowSums = np.zeros(3)
+        self._windowImport = 0.0
+        self._windowPeak = deque()          # (step, grid load), decreasing grid loads
+
+    def update(self, hour, buildingLoad, reGeneration, gridLoad, comments):
+        '''Add one time step
+        ------------------------------------
+        Args
+            -- hour, hour of the day of the time step
+            -- buildingLoad, reGeneration, total building load and renewable generation of the time step, unit: kW
+            -- gridLoad, grid load (reward) of the time step, unit: kW
+            -- comments, comments of the time step returned by BEVCommunity.step
+        ------------------------------------
+        '''
+        vehicleCharge = comments[2]
+        self.steps += 1
+        self.gridSum.add(gridLoad)
+        if gridLoad > 0:
+            self.importSum.add(gridLoad)
+            self.importCount += 1
+        elif gridLoad < 0:
+            self.exportSum.add(gridLoad)
+            self.exportCount += 1
+        self.buildingSum.add(buildingLoad)
+        self.vehicleChargeSum.add(vehicleCharge)
+
+        self.hourCount[hour] += 1
+        self.hourSums[0, hour] += buildingLoad
+        self.hourSums[1, hour] += reGeneration
+        self.hourSums[2, hour] += gridLoad
+
+        values = (gridLoad, buildingLoad, vehicleCharge)
+        self._windowValues.append(values)
+        self._windowSums += values
+        self._windowImport += max(gridLoad, 0)
+        while self._windowPeak and self._windowPeak[-1][1] <= gridLoad:
+            self._windowPeak.pop()
+        self._windowPeak.append((self.steps, gridLoad))
+        if len(self._windowValues) > self.window:
+            oldValues = self._windowValues.popleft()
+            self._windowSums -= oldValues
+            self._windowImport -= max(oldValues[0], 0)
+        if self._windowPeak[0][0] <= self.steps - self.window:
+            self._windowPeak.popleft()
+
+    def summary(self):
+        '''Indicators of all steps so far, named as in Simulation.ipynb
+        '''
+        step_h = self.step_h
+        gridEle = self.gridSum.value*step_h
+        buildDem = self.buildingSum.value*step_h
+        vehicleDem = self.vehicleChargeSum.value*step_h
+        carbonEmis = gridEle*self.carbonFac_ele
+        carbonRedu = (buildDem+vehicleDem - gridEle)*self.carbonFac_ele
+        totalDistance = vehicleDem/self.vehicleEff
+        carbonRedu_veh = totalDistance/self.gasolineEff*self.carbonFac_gas
+        demand = self.buildingSum.value + self.vehicleChargeSum.value
+        return {
+            'energyIndep': (1 - self.importSum.value/demand)*100 if demand else np.nan,     # %
+            'gridEle': gridEle,                                                              # kWh
+            'buildDem': buildDem,                                                            # kWh
+            'vehicleDem': vehicleDem,                                                        # kWh
+            'carbonEmis': carbonEmis,                                                        # kg
+            'carbonRedu': carbonRedu,                                                        # kg
+            'carbonRedu_veh': carbonRedu_veh,                                                # kg
+            'carbonTotal': carbonRedu + carbonRedu_veh,                                      # kg
+            'grid_importEle': self.importSum.value,                                          # sum of the import power, kWh for hourly steps
+            'grid_exportEle': self.exportSum.value,                                          # sum of the export power, kWh for hourly steps
+            'gridImport_time': self.importCount*step_h,                                      # h
+            'gridImport_power': self.importSum.value/self.importCount if self.importCount else np.nan,   # kW
+            'gridExport_time': self.exportCount*step_h,                                      # h
+            'gridExport_power': self.exportSum.value/self.exportCount if self.exportCount else np.nan,   # kW
+        }
+
+    def hourly(self):
+        '''Mean building load, renewable generation, reference power and grid power of each hour of the day, unit: kW
+        The reference power is the grid power without the onsite battery and the vehicles
+        '''
+        with np.errstate(invalid='ignore', divide='ignore'):
+            buildingLoad, reGeneration, gridPower = self.hourSums/self.hourCount
+        return {'buildingLoad': buildingLoad, 'reGeneration': reGeneration,
+                'refPower': buildingLoad - 0.95*reGeneration, 'gridPower': gridPower}
+
+    def rolling(self):
+        '''Indicators over the last window steps
+        '''
+        steps = len(self._windowValues)
+        if steps == 0:
+            return {'steps': 0, 'gridLoad_mean': np.nan, 'gridImport_peak': np.nan, 'energyIndep': np.nan}
+        gridSum, buildingSum, vehicleChargeSum = self._windowSums
+        demand = buildingSum + vehicleChargeSum
+        return {
+            'steps': steps,
+            'gridLoad_mean': gridSum/steps,                                                  # kW
+            'gridImport_peak': max(self._windowPeak[0][1], 0),                               # kW
+            'energyIndep': (1 - self._windowImport/demand)*100 if demand else np.nan,       # %
+        }
+
+
+class KPITracker(gym.Wrapper):
+
+    def __init__(self, env, per_episode=True, **kwargs):
+        '''Update a KPIAccumulator at each step of a BEVCommunity environment
+        The info returned by step() is a dict of the step comments and the accumulator
+        ------------------------------------
+        Args
+            -- env, BEVCommunity environment
+            -- per_episode, restart the indicators at each reset
+            -- kwargs, carbon factors and window of the KPIAccumulator
+        ------------------------------------
+        '''
+        super().__init__(env)
+        self.per_episode = per_episode
+        self.kpi = KPIAccumulator(step_h=self.env.unwrapped.stepLenth/3600, **kwargs)
+
+    def reset(self, **kwargs):
+        if self.per_episode:
+            self.kpi.reset()
+        return self.env.reset(**kwargs)
+
+    def step(self, actions):
+        env = self.env.unwrapped
+        time_step_idx = env.time_step_idx
+        obs, reward, done, comments = self.env.step(actions)
+        self.kpi.update(env.stepHour[time_step_idx], env.buildingLoad[time_step_idx], env.reGeneration[time_step_idx], reward, comments)
+        return obs, reward, done, {'comments': comments, 'kpi': self.kpi}
+
+    def summary(self):
+        return self.kpi.summary()
@@ -1,37 +1,73 @@
+import copy
 import pandas as pd
 import numpy as np
 from datetime import datetime
 
+from cache import profileCache
+from timeseries import TimeSeriesProvider
+
 
 class dataFromCSV():
 
-    def __init__(self, csv_file, stepLenth, simulationYear):
-        '''Input csv file needs to be hourly load 
+    def __init__(self, csv_file, stepLenth, simulationYear, n_steps=None, cache=None):
+        '''Input csv file needs to be one year of load, hourly or at a finer resolution such as 15 minutes
+        An already parsed load (array of one year of values) can be given instead of the csv file
+        The parsed load of a csv file is taken from the profile cache, see cache.py
+        ------------------------------------
+        Args
+            -- stepLenth, lenth of each time step, unit: s
+            -- simulationYear, year of the first time step
+            -- n_steps, number of time steps, default one year, the load repeats every year
+        ------------------------------------
         '''
         self.csv_file = csv_file
-        self.load = pd.read_csv(self.csv_file, index_col=0)
-        ## Check the input load
-        assert self.load.shape[0] == 8760, "Input building load file needs to be hourly."
-        if self.load.shape[1] > 1:
-            print('Input building load file have more than 1 column, only the first column will be used.')
         self.stepLenth = stepLenth  #unit: s
-        self.setTimeStep(simulationYear)
+        self.simulationYear = simulationYear
+        self.n_steps = 8760*3600//stepLenth if n_steps is None else n_steps
+        self._load = None
+        if isinstance(csv_file, np.ndarray):
+            source = self._checkLoad(csv_file.reshape(csv_file.shape[0], -1))[:, 0]
+        else:
+            cache = profileCache if cache is None else cache
+            source = cache.getArray(csv_file, self._readCSV)
+        self.setTimeStep(source)
 
-    def setTimeStep(self, simulationYear):
-        start_time = datetime(year = simulationYear, month = 1, day =1)
-        self.load.index = pd.date_range(start_time, periods = self.load.shape[0], freq = 'H')
-        self.load = self.load.resample('{}T'.format(self.stepLenth/60)).interpolate()
+    @property
+    def load(self):
+        '''Load of each time step as a DataFrame indexed by time, built on first use
+        '''
+        if self._load is None:
+            start_time = datetime(year = self.simulationYear, month = 1, day =1)
+            timeIndex = pd.date_range(start_time, periods = self.n_steps, freq = '{}S'.format(self.stepLenth))
+            self._load = pd.DataFrame({'load': np.asarray(self.values)}, index = timeIndex)
+        return self._load
+
+    def setTimeStep(self, source):
+        '''Values of each time step, interpolated lazily from the source load
+        '''
+        self.values = TimeSeriesProvider(source, self.stepLenth, self.n_steps)
+
+    def _readCSV(self, csv_file):
+        load = pd.read_csv(csv_file, index_col=0).values
+        return self._checkLoad(load)[:, 0].astype(float)
+
+    def _checkLoad(self, load):
+        ## Check the input load
+        assert load.shape[0] > 0 and 8760*3600 % load.shape[0] == 0, "Input building load file needs to be one year of hourly (or finer) load."
+        if load.shape[1] > 1:
+            print('Input building load file have more than 1 column, only the first column will be used.')
+        return load
 
 
 class Building(dataFromCSV):
 
-    def __init__(self, csv_file, stepLenth, simulationYear):
-        super().__init__(csv_file, stepLenth, simulationYear)
+    def __init__(self, csv_file, stepLenth, simulationYear, n_steps=None):
+        super().__init__(csv_file, stepLenth, simulationYear, n_steps)
 
     def getLoad(self, timeStep):
         '''Time step start with 0
         '''
-        return self.load.iloc[timeStep, 0]
+        return self.values[timeStep]
     
     def getLoadFullYear(self):
         return self.load
@@ -39,13 +75,13 @@ class Building(dataFromCSV):
 
 class RE(dataFromCSV):
 
-    def __init__(self, csv_file, stepLenth, simulationYear):
-        super().__init__(csv_file, stepLenth, simulationYear)
+    def __init__(self, csv_file, stepLenth, simulationYear, n_steps=None):
+        super().__init__(csv_file, stepLenth, simulationYear, n_steps)
 
     def getPower(self, timeStep):
         '''Time step start with 0
         '''
-        return self.load.iloc[timeStep, 0]
+        return self.values[timeStep]
 
     def getPowerFullYear(self):
         return self.load
@@ -66,24 +102,72 @@ class Vehicle:
         State
             -- batterySOC: current state of charge of the vehicle battery.
         '''
-        self.vehicle_info = pd.read_csv(csv_file)
-        self.vehicle_schd = pd.read_csv(schd_file)
-        self.cruiseEff = float(self.vehicle_info.loc[0,'cruiseEff'])  # unit: kWh/km
-        self.dist_mu_wd = float(self.vehicle_info.loc[0,'dist_mean_wd'])
-        self.dist_sigma_wd = float(self.vehicle_info.loc[0,'dist_std_wd'])
-        self.dist_mu_nwd = float(self.vehicle_info.loc[0,'dist_mean_nwd'])
-        self.dist_sigma_nwd = float(self.vehicle_info.loc[0,'dist_std_nwd'])
-        self.maxChargingCapacity = float(self.vehicle_info.loc[0,'maxChargingCapacity']) # unit: kW
-        self.maxDischargingCapacity = float(self.vehicle_info.loc[0,'maxDischargingCapacity']) # unit: kW
-        self.charEff = float(self.vehicle_info.loc[0,'charEff'])
-        self.discEff = float(self.vehicle_info.loc[0,'discEff']) 
-        self.batteryCapacity = float(self.vehicle_info.loc[0,'batteryCapacity']) # unit: kWh
-        self.parkSchd_wd = self.vehicle_schd[self.vehicle_info.loc[0,'parkSchd_wd']]
-        self.parkSchd_nwd = self.vehicle_schd[self.vehicle_info.loc[0,'parkSchd_nwd']]
+        self.csv_file = csv_file
+        self.schd_file = schd_file
+        # Parameters and parking schedules are parsed once per file content and shared by the vehicles
+        self.vehicleType = profileCache.getRecord(csv_file, _readVehicleParameters)
+        self.parkSchedule = profileCache.getRecord(schd_file, _readParkSchedule, lambda record: ParkSchedule(schd_file, record))
+        self.cruiseEff = self.vehicleType['cruiseEff']  # unit: kWh/km
+        self.dist_mu_wd = self.vehicleType['dist_mean_wd']
+        self.dist_sigma_wd = self.vehicleType['dist_std_wd']
+        self.dist_mu_nwd = self.vehicleType['dist_mean_nwd']
+        self.dist_sigma_nwd = self.vehicleType['dist_std_nwd']
+        self.maxChargingCapacity = self.vehicleType['maxChargingCapacity'] # unit: kW
+        self.maxDischargingCapacity = self.vehicleType['maxDischargingCapacity'] # unit: kW
+        self.charEff = self.vehicleType['charEff']
+        self.discEff = self.vehicleType['discEff']
+        self.batteryCapacity = self.vehicleType['batteryCapacity'] # unit: kWh
+        self.parkSchd_wd_col = self.vehicleType['parkSchd_wd']
+        self.parkSchd_nwd_col = self.vehicleType['parkSchd_nwd']
         self.stepLenth = stepLenth/3600                # unit: h
+        # The battery state is held by a VehicleFleet once the vehicle is attached to one
+        self._fleet = None
+        self._fleetIdx = None
         # Initialize electricity storage in the vehicle battery
         self.batteryVol = self.batteryCapacity/2    # unit: kWh
         self.batterySOC = self.batteryVol/self.batteryCapacity
+
+    @property
+    def vehicle_info(self):
+        return pd.read_csv(self.csv_file)
+
+    @property
+    def vehicle_schd(self):
+        return self.parkSchedule.frame
+
+    @property
+    def parkSchd_wd(self):
+        return self.parkSchedule.frame[self.parkSchd_wd_col]
+
+    @property
+    def parkSchd_nwd(self):
+        return self.parkSchedule.frame[self.parkSchd_nwd_col]
+
+    @property
+    def batteryVol(self):
+        if self._fleet is None:
+            return self._batteryVol
+        return self._fleet.batteryVol[self._fleetIdx]
+
+    @batteryVol.setter
+    def batteryVol(self, value):
+        if self._fleet is None:
+            self._batteryVol = value
+        else:
+            self._fleet.batteryVol[self._fleetIdx] = value
+
+    @property
+    def batterySOC(self):
+        if self._fleet is None:
+            return self._batterySOC
+        return self._fleet.batterySOC[self._fleetIdx]
+
+    @batterySOC.setter
+    def batterySOC(self, value):
+        if self._fleet is None:
+            self._batterySOC = value
+        else:
+            self._fleet.batterySOC[self._fleetIdx] = value
     
     def vehicleCharge(self, chargeRate):
         '''
@@ -118,27 +202,263 @@ class Vehicle:
         self.batterySOC -= dischargeElectricity / self.discEff/self.batteryCapacity
         return realDischargeRate
 
-    def cruise(self, workingDay):
-        eleConsumption = self._getEleConsumption(workingDay)
+    def cruise(self, workingDay, distance=None):
+        eleConsumption = self._getEleConsumption(workingDay, distance)
         self.batteryVol -= eleConsumption
         self.batterySOC -= eleConsumption/self.batteryCapacity
 
-    def _getEleConsumption(self, workingDay):
-        distance = self._getDistance(workingDay)
+    def _getEleConsumption(self, workingDay, distance=None):
+        if distance is None:
+            distance = self._getDistance(workingDay)
         eleConsumption = self.cruiseEff*distance         # unit: kWh
         return eleConsumption
     
     def _getDistance(self, workingDay):
         if workingDay:
-            self.distance = np.random.normal(self.dist_mu_wd, self.dist_sigma_wd, 1)[0]
+            self.distance = drawDistance(self.dist_mu_wd, self.dist_sigma_wd)
         else:
-            self.distance = np.random.normal(self.dist_mu_nwd, self.dist_sigma_nwd, 1)[0]
+            self.distance = drawDistance(self.dist_mu_nwd, self.dist_sigma_nwd)
         return self.distance
 
     def getParkSchd(self, workingDay):
         self.parkSchd = self.parkSchd_wd if workingDay else self.parkSchd_nwd
         return self.parkSchd
 
+def _readVehicleParameters(csv_file):
+    '''Parse the key parameters of a vehicle from its csv file
+    '''
+    vehicle_info = pd.read_csv(csv_file)
+    record = {name: float(vehicle_info.loc[0, name]) for name in ['cruiseEff', 'dist_mean_wd', 'dist_std_wd', 'dist_mean_nwd', 'dist_std_nwd',
+                                                                 'maxChargingCapacity', 'maxDischargingCapacity', 'charEff', 'discEff', 'batteryCapacity']}
+    record['parkSchd_wd'] = str(vehicle_info.loc[0, 'parkSchd_wd'])
+    record['parkSchd_nwd'] = str(vehicle_info.loc[0, 'parkSchd_nwd'])
+    return record
+
+
+def _readParkSchedule(schd_file):
+    '''Parse the parking schedules from the schedule csv file, the first column is the hour index
+    '''
+    vehicle_schd = pd.read_csv(schd_file)
+    return {'columns': [str(column) for column in vehicle_schd.columns[1:]],
+            'table': vehicle_schd.iloc[:, 1:].values.astype(int).tolist()}
+
+
+class ParkSchedule:
+
+    def __init__(self, schd_file, record):
+        '''Parking schedules shared by all vehicles using the same schedule file
+        ------------------------------------
+        Args
+            -- schd_file, parking schedule file
+            -- record, parsed schedules, see _readParkSchedule
+        ------------------------------------
+        '''
+        self.schd_file = schd_file
+        self.columns = record['columns']
+        self.table = np.array(record['table'], dtype=np.int8)      # hour x schedule
+        self._frame = None
+
+    @property
+    def frame(self):
+        '''The schedule file as a DataFrame, read on first use
+        '''
+        if self._frame is None:
+            self._frame = pd.read_csv(self.schd_file)
+        return self._frame
+
+
+class VehicleFleet:
+
+    def __init__(self, vehicles, stepLenth):
+        '''Struct-of-arrays container of a group of vehicles
+        Charges, discharges and cruises the whole fleet in one vectorized pass,
+        following the same rules as Vehicle.vehicleCharge, Vehicle.eleToGrid and Vehicle.cruise
+        The vehicles are attached to the fleet, so their batteryVol and batterySOC read from the fleet arrays
+        ------------------------------------
+        Args
+            -- vehicles, list of Vehicle objects sharing the same parking schedule file
+            -- stepLenth, lenth of each time step, unit: s
+        ------------------------------------
+        State
+            -- batteryVol: array, electricity stored in each vehicle battery, unit: kWh
+            -- batterySOC: array, state of charge of each vehicle battery
+        '''
+        self.vehicleNum = len(vehicles)
+        self.stepLenth = stepLenth/3600                # unit: h
+        self.cruiseEff = np.array([vehicle.cruiseEff for vehicle in vehicles], dtype=float)
+        self.dist_mu_wd = np.array([vehicle.dist_mu_wd for vehicle in vehicles], dtype=float)
+        self.dist_sigma_wd = np.array([vehicle.dist_sigma_wd for vehicle in vehicles], dtype=float)
+        self.dist_mu_nwd = np.array([vehicle.dist_mu_nwd for vehicle in vehicles], dtype=float)
+        self.dist_sigma_nwd = np.array([vehicle.dist_sigma_nwd for vehicle in vehicles], dtype=float)
+        self.maxChargingCapacity = np.array([vehicle.maxChargingCapacity for vehicle in vehicles], dtype=float)
+        self.maxDischargingCapacity = np.array([vehicle.maxDischargingCapacity for vehicle in vehicles], dtype=float)
+        self.charEff = np.array([vehicle.charEff for vehicle in vehicles], dtype=float)
+        self.discEff = np.array([vehicle.discEff for vehicle in vehicles], dtype=float)
+        self.batteryCapacity = np.array([vehicle.batteryCapacity for vehicle in vehicles], dtype=float)
+
+        # Parking schedule ids, i.e. the column position in the parking schedule file
+        if vehicles:
+            self.schdColumns = vehicles[0].parkSchedule.columns
+        else:
+            self.schdColumns = []
+        self.schdId_wd = np.array([self.schdColumns.index(str(vehicle.parkSchd_wd_col)) for vehicle in vehicles], dtype=np.int64)
+        self.schdId_nwd = np.array([self.schdColumns.index(str(vehicle.parkSchd_nwd_col)) for vehicle in vehicles], dtype=np.int64)
+        # Row 0 for non-working days and row 1 for working days, indexed by the day type of the time step
+        self.schdId = np.stack([self.schdId_nwd, self.schdId_wd])
+        self.maxDist = np.stack([self.dist_mu_nwd+5*self.dist_sigma_nwd, self.dist_mu_wd+5*self.dist_sigma_wd])
+
+        # Park state and return-hour mask of each hour (row) and each parking schedule (column)
+        if vehicles:
+            self.parkTable = vehicles[0].parkSchedule.table
+        else:
+            self.parkTable = np.zeros((24, 0), dtype=np.int8)
+        self.returnTable = np.zeros(self.parkTable.shape, dtype=bool)
+        for schd_i in range(self.parkTable.shape[1]):
+            awayHours = np.flatnonzero(self.parkTable[:, schd_i] == 0)
+            # The vehicle returns at the hour after its last away hour
+            if awayHours.size and awayHours[-1]+1 < self.parkTable.shape[0]:
+                self.returnTable[awayHours[-1]+1, schd_i] = True
+
+        self.batteryVol = np.array([vehicle.batteryVol for vehicle in vehicles], dtype=float)
+        self.batterySOC = np.array([vehicle.batterySOC for vehicle in vehicles], dtype=float)
+        for idx, vehicle in enumerate(vehicles):
+            vehicle._fleet = self
+            vehicle._fleetIdx = idx
+
+    def getStateStatic(self, dayType, hour):
+        '''Get the park state, predicted maximum travel distance and return-hour mask of all vehicles
+        ------------------------------------
+        Args
+            -- dayType, 1 for working days and 0 for non-working days
+            -- hour, hour of the day
+            dayType and hour can also be arrays of shape (n,) for n communities sharing the fleet parameters
+        ------------------------------------
+        Output
+            -- vehicles_park, array, 1 for at home, 0 for not at home
+            -- vehicles_max_dist, array, predicted maximum travel distance
+            -- cruiseMask, boolean array, whether it is the hour the vehicle returns to home
+        '''
+        schdId = self.schdId[dayType]
+        if np.ndim(hour):
+            hour = np.asarray(hour)[:, None]
+        return self.parkTable[hour, schdId], self.maxDist[dayType], self.returnTable[hour, schdId]
+
+    def chargeAndDischarge(self, actions, plantNum):
+        '''Charge the vehicles with positive actions and discharge the others to the grid
+        Vehicles are served in fleet order, and a power plant is taken by each vehicle that is really charged,
+        the charging requests beyond plantNum are dropped
+        ------------------------------------
+        Args
+            -- actions, array of control signals, positive for charging, unit: kW
+            -- plantNum, power plant quantity for charging vehicles
+        ------------------------------------
+        Output
+            -- realChargeRate, array of real charge rates, unit: kW
+            -- realDischargeRate, array of real discharge power, unit: kW
+        '''
+        actions = np.asarray(actions, dtype=float)
+        charging = actions > 0
+
+        realChargeRate = np.minimum(np.minimum(actions, self.maxChargingCapacity), (self.batteryCapacity-self.batteryVol)/self.stepLenth/self.charEff)
+        realChargeRate = np.where(charging, realChargeRate, 0)
+        # Power plants are occupied by the charged vehicles in fleet order
+        plantUsed = realChargeRate != 0
+        served = np.cumsum(plantUsed, axis=-1) <= plantNum
+        realChargeRate = np.where(served, realChargeRate, 0)
+
+        realDischargeRate = np.minimum(np.minimum(-actions, self.maxDischargingCapacity), self.batteryVol/self.stepLenth*self.discEff)
+        realDischargeRate = np.where(charging, 0, realDischargeRate)
+
+        chargeElectricity = realChargeRate * self.stepLenth
+        dischargeElectricity = realDischargeRate * self.stepLenth
+        self.batteryVol += chargeElectricity * self.charEff
+        self.batterySOC += chargeElectricity * self.charEff/self.batteryCapacity
+        self.batteryVol -= dischargeElectricity / self.discEff
+        self.batterySOC -= dischargeElectricity / self.discEff/self.batteryCapacity
+        return realChargeRate, realDischargeRate
+
+    def batch(self, n):
+        '''Return a fleet sharing the (read-only) parameters and tables of this fleet,
+        with the battery state of n independent copies stored as arrays of shape (n, vehicleNum)
+        '''
+        fleet = copy.copy(self)
+        # Methods wrapped on the instance, e.g. by a StepProfiler, are bound to this fleet, the batch uses the class methods
+        for name in [name for name in vars(fleet) if callable(getattr(type(fleet), name, None))]:
+            delattr(fleet, name)
+        fleet.batteryVol = np.tile(self.batteryVol, (n, 1))
+        fleet.batterySOC = np.tile(self.batterySOC, (n, 1))
+        return fleet
+
+    def drive(self, cruiseMask, distance):
+        '''Reduce the stored electricity of the vehicles returning home by the given travel distances
+        ------------------------------------
+        Args
+            -- cruiseMask, boolean array, whether it is the hour the vehicle returns to home
+            -- distance, array of travel distances, unit: km
+        '''
+        eleConsumption = np.where(cruiseMask, self.cruiseEff*distance, 0)         # unit: kWh
+        self.batteryVol -= eleConsumption
+        self.batterySOC -= eleConsumption/self.batteryCapacity
+
+    def cruise(self, cruiseMask, workingDay):
+        '''Reduce the stored electricity of the vehicles returning home
+        ------------------------------------
+        Args
+            -- cruiseMask, boolean array, whether it is the hour the vehicle returns to home
+            -- workingDay, whether the daily distance follows the working-day distribution
+        '''
+        cruiseIdx = np.flatnonzero(cruiseMask)
+        if cruiseIdx.size == 0:
+            return
+        distance = self.drawCruiseDistances(cruiseIdx, workingDay)
+        eleConsumption = self.cruiseEff[cruiseIdx]*distance         # unit: kWh
+        self.batteryVol[cruiseIdx] -= eleConsumption
+        self.batterySOC[cruiseIdx] -= eleConsumption/self.batteryCapacity[cruiseIdx]
+
+    def drawCruiseDistances(self, cruiseIdx, workingDay):
+        '''Draw the travel distances of the given vehicles from the global random generator, in the order of step()
+        ------------------------------------
+        Args
+            -- cruiseIdx, indices of the vehicles returning home
+            -- workingDay, whether the daily distance follows the working-day distribution
+        ------------------------------------
+        Output
+            -- distance, array (cruiseIdx.size,), negative draws are set to 0, unit: km
+        '''
+        if workingDay:
+            return drawDistance(self.dist_mu_wd[cruiseIdx], self.dist_sigma_wd[cruiseIdx])
+        return drawDistance(self.dist_mu_nwd[cruiseIdx], self.dist_sigma_nwd[cruiseIdx])
+
+    def sampleDistances(self, dayTypes, rng):
+        '''Draw the daily travel distances of all vehicles over a sequence of days in one call
+        ------------------------------------
+        Args
+            -- dayTypes, array (n_days,), 1 for working days and 0 for non-working days
+            -- rng, numpy random Generator
+        ------------------------------------
+        Output
+            -- distance, array (n_days, vehicleNum), negative draws are set to 0, unit: km
+        '''
+        workingDay = np.asarray(dayTypes, dtype=bool)[:, None]
+        mu = np.where(workingDay, self.dist_mu_wd, self.dist_mu_nwd)
+        sigma = np.where(workingDay, self.dist_sigma_wd, self.dist_sigma_nwd)
+        return drawDistance(mu, sigma, rng)
+
+
+def drawDistance(mu, sigma, rng=None):
+    '''Draw travel distances from normal distributions, negative draws are set to 0
+    rng is a numpy random Generator, default the global random generator
+    '''
+    return np.maximum((np.random if rng is None else rng).normal(mu, sigma), 0)
+
+
+def _readBatteryParameters(csv_file):
+    '''Parse the key parameters of the onsite battery from its csv file
+    '''
+    battery_info = pd.read_csv(csv_file)
+    return {name: float(battery_info.loc[0, name]) for name in ['charEff', 'charCap', 'discEff', 'discCap', 'batteryCapacity']}
+
+
 class BatteryOnsite:
 
     def __init__(self, csv_file, stepLenth):
@@ -151,17 +471,22 @@ class BatteryOnsite:
         ------------------------------------
         '''
         
-        self.battery_info = pd.read_csv(csv_file)
-        self.charEff = float(self.battery_info.loc[0,'charEff'])  
-        self.charCap = float(self.battery_info.loc[0,'charCap'])  # unit: kW
-        self.discEff = float(self.battery_info.loc[0,'discEff'])  
-        self.discCap = float(self.battery_info.loc[0,'discCap'])  # unit: kW
-        self.capacityMax = float(self.battery_info.loc[0,'batteryCapacity'])  # unit: kWh
+        self.csv_file = csv_file
+        battery_info = profileCache.getRecord(csv_file, _readBatteryParameters)
+        self.charEff = battery_info['charEff']  
+        self.charCap = battery_info['charCap']  # unit: kW
+        self.discEff = battery_info['discEff']  
+        self.discCap = battery_info['discCap']  # unit: kW
+        self.capacityMax = battery_info['batteryCapacity']  # unit: kWh
         self.stepLenth = stepLenth           # unit: h
         # Initialize electricity storage in the battery
         self.batteryVol = 0
                  
 
+    @property
+    def battery_info(self):
+        return pd.read_csv(self.csv_file)
+
     def batteryCharge(self, chargeRate):
         '''
         ------------------------------------
@@ -196,6 +521,28 @@ class BatteryOnsite:
         self.batteryVol -= dischargeElectricity / self.discEff
         return realDischargeRate, dischargeElectricity
 
+    def batteryDispatch(self, renewableSurplus, demandShortage, batteryVol):
+        '''Vectorized counterpart of batteryCharge and batteryDischarge for a batch of batteries sharing these parameters
+        The battery is charged with the renewable surplus, or discharged to cover the demand shortage
+        ------------------------------------
+        Args
+            -- renewableSurplus, array, unit: kW
+            -- demandShortage, array, unit: kW
+            -- batteryVol, array of stored electricity, updated in place, unit: kWh
+        ------------------------------------
+        Output
+            -- realChargeRate, array, unit: kW
+            -- realDischargeRate, array, unit: kW
+        '''
+        discharging = demandShortage > 0
+        realChargeRate = np.minimum(np.minimum(renewableSurplus, self.charCap), (self.capacityMax-batteryVol)/self.stepLenth/self.charEff)
+        realChargeRate = np.where(discharging, 0, realChargeRate)
+        batteryVol += realChargeRate * self.stepLenth * self.charEff
+        realDischargeRate = np.minimum(np.minimum(demandShortage, self.discCap), batteryVol/self.stepLenth*self.discEff)
+        realDischargeRate = np.where(discharging, realDischargeRate, 0)
+        batteryVol -= realDischargeRate * self.stepLenth / self.discEff
+        return realChargeRate, realDischargeRate
+
 
 
 
@@ -0,0 +1,125 @@
+import numpy as np
+
+'''
+Vectorized charging policies of BEVCommunity
+1. The normal, scheduled and responsive charging modes of check_and_charge in Simulation.ipynb, applied to the whole fleet at once
+2. A policy maps the state array, the previous action array and the hour of the day to the action array,
+   the state may also be a batch of states (n, n_obs) with an array of hours (n,), e.g. from BEVCommunityVec
+3. run_episode runs a whole episode with a policy and returns the hourly results as arrays
+'''
+
+PEAK_HOURS = (7, 8, 9, 17, 18, 19, 20, 21, 22, 23)
+NIGHT_HOURS = (0, 1, 2, 3, 4, 5, 6)
+SURPLUS_HOURS = (10, 11, 12, 13, 14, 15, 16)
+
+
+def splitObs(obs):
+    '''Parking states and SOCs of the vehicles in a state array, or in each row of a batch of states
+    '''
+    obs = np.asarray(obs)
+    vehicle_n = (obs.shape[-1]-4)//3
+    return obs[..., 4:4+vehicle_n], obs[..., 4+2*vehicle_n:]
+
+
+class ScheduledCharge:
+
+    def __init__(self, power1=0, period1=PEAK_HOURS, power2=20, period2=NIGHT_HOURS, power3=20, period3=SURPLUS_HOURS,
+                 threshold_lower=0.1, threshold_upper=1, threshold_upper2=None):
+        '''Scheduled charging mode, vehicle charging is only activated during certain hours of a day
+        ------------------------------------
+        Args
+            -- power1, power2, maximum charging power during period 1 and period 2, unit: kW
+               during these periods a parked vehicle starts charging when its SOC is lower than threshold_lower,
+               and keeps charging until its SOC reaches threshold_upper2
+            -- power3, maximum charging power during period 3, unit: kW
+               during this period a parked vehicle is charged as long as its SOC is lower than threshold_upper
+            -- period1, period2, period3, hours of the day of each period, other hours have zero charging power
+            -- threshold_lower, SOC under which the charging of a parked vehicle is activated
+            -- threshold_upper, SOC at which the charging is stopped
+            -- threshold_upper2, SOC at which the charging is stopped during period 1 and period 2, default threshold_upper
+        ------------------------------------
+        '''
+        self.threshold_lower = threshold_lower
+        self.threshold_upper = threshold_upper
+        self.threshold_upper2 = threshold_upper if threshold_upper2 is None else threshold_upper2
+        # Lookup tables of the hour of the day, the first listed period wins on shared hours
+        self.powerTable = np.zeros(24)
+        self.surplusTable = np.zeros(24, dtype=bool)
+        assigned = np.zeros(24, dtype=bool)
+        for power, period, surplus in ((power1, period1, False), (power2, period2, False), (power3, period3, True)):
+            hours = np.zeros(24, dtype=bool)
+            hours[list(period)] = True
+            hours &= ~assigned
+            self.powerTable[hours] = power
+            self.surplusTable[hours] = surplus
+            assigned |= hours
+
+    def __call__(self, obs, preAction, hour):
+        vehicles_park, vehicles_SOC = splitObs(obs)
+        vehicles_SOC = np.round(vehicles_SOC, 2)
+        hour = np.asarray(hour)[..., None]
+        power = self.powerTable[hour]
+        charging = (vehicles_SOC < self.threshold_lower) | ((np.asarray(preAction) > 0) & (vehicles_SOC < self.threshold_upper2))
+        charging = np.where(self.surplusTable[hour], vehicles_SOC < self.threshold_upper, charging)
+        return np.where((vehicles_park == 1) & charging, power, 0.)
+
+
+class NormalCharge(ScheduledCharge):
+
+    def __init__(self, charging_power=20, threshold_lower=0.1, threshold_upper=1):
+        '''Normal charging mode, the charging of a parked vehicle is activated whenever its SOC is lower than threshold_lower,
+        and kept until its SOC reaches threshold_upper
+        ------------------------------------
+        Args
+            -- charging_power, rated vehicle charging power, unit: kW
+        ------------------------------------
+        '''
+        super().__init__(power1=charging_power, period1=range(24), period2=(), period3=(),
+                         threshold_lower=threshold_lower, threshold_upper=threshold_upper)
+
+
+class ResponsiveCharge(ScheduledCharge):
+
+    def __init__(self, power1=0, period1=PEAK_HOURS, power2=5, period2=NIGHT_HOURS, power3=20, period3=SURPLUS_HOURS,
+                 threshold_lower=0.1, threshold_upper=1, threshold_upper2=0.3):
+        '''Responsive charging mode, a reduced upper threshold and charging power during the demand-shortage periods 1 and 2,
+        and a large charging power during the renewable-surplus period 3
+        The arguments are those of ScheduledCharge
+        '''
+        super().__init__(power1, period1, power2, period2, power3, period3, threshold_lower, threshold_upper, threshold_upper2)
+
+
+def run_episode(env, policy, seed=None, record_actions=False, scenario=None):
+    '''Run one episode of a BEVCommunity environment with a charging policy
+    ------------------------------------
+    Args
+        -- env, BEVCommunity environment
+        -- policy, policy(obs, preAction, hour) -> action array
+        -- seed, seed of the global random generator used for the cruise distances, None to leave it as is
+        -- record_actions, also return the action array of each step
+        -- scenario, array (n_days, n_vehicles) of the daily travel distances of the episode, see BEVCommunity.reset
+    ------------------------------------
+    Output
+        -- dict of arrays: gridLoad (n_steps,), comments (n_steps, 4) and actions (n_steps, n_vehicles) if recorded
+    '''
+    env = env.unwrapped
+    if seed is not None:
+        np.random.seed(seed)
+    results = {'gridLoad': np.empty(env.n_steps), 'comments': np.empty((env.n_steps, 4))}
+    if record_actions:
+        results['actions'] = np.empty((env.n_steps, len(env.action_names)))
+
+    reuse_obs = env.reuse_obs
+    env.reuse_obs = True
+    try:
+        preAction = np.zeros(len(env.action_names))
+        obs = env.reset(scenario=scenario)
+        for step_i in range(env.n_steps):
+            actions = np.asarray(policy(obs, preAction, env.stepHour[env.time_step_idx]), dtype=float)
+            obs, results['gridLoad'][step_i], done, results['comments'][step_i] = env.step(actions)
+            if record_actions:
+                results['actions'][step_i] = actions
+            preAction = actions
+    finally:
+        env.reuse_obs = reuse_obs
+    return results
@@ -0,0 +1,152 @@
+import logging
+import time
+
+import numpy as np
+
+'''
+Opt-in instrumentation of BEVCommunity
+1. attach() wraps the methods of each phase of step(), reset() and the constructor with timers, on the instances only,
+   so an environment without a profiler runs the unchanged class methods at no cost
+2. The charging of the vehicle fleet is also counted: charger-cap hits against plantNum, clipped charge requests and SOC saturation
+3. The statistics are queried with stats() or written as a log line every log_every steps
+'''
+
+logger = logging.getLogger(__name__)
+
+# Instrumented methods of the environment and of its models, as (attribute of the model, method name)
+ENV_PHASES = ((None, 'step'), (None, 'reset'), (None, '_calculateBuildingLoad'), (None, '_calculateReGeneration'),
+              (None, '_getLoad'), (None, '_stepFleet'), (None, '_stepVehicles'), (None, '_getVehicleStateStatic'), (None, '_getObs'),
+              ('fleet', 'getStateStatic'), ('fleet', 'chargeAndDischarge'), ('fleet', 'cruise'), ('fleet', 'drive'),
+              ('batteryOnsite', 'batteryCharge'), ('batteryOnsite', 'batteryDischarge'))
+COUNTER_NAMES = ('chargerCapHits', 'chargerCapDropped', 'chargeRequests', 'chargeClipped', 'socFull', 'socEmpty', 'socNegative')
+
+
+class StepProfiler:
+
+    def __init__(self, log_every=None, count_events=True):
+        '''Timers of the phases of BEVCommunity and counters of the fleet charging
+        ------------------------------------
+        Args
+            -- log_every, write the statistics as a log line every log_every steps, None for no log
+            -- count_events, count charger-cap hits, clipped charge requests and SOC saturation of the vectorized fleet
+        ------------------------------------
+        Counters
+            -- chargerCapHits, steps with more chargeable vehicles than power plants
+            -- chargerCapDropped, charge requests dropped as all power plants were taken
+            -- chargeRequests, positive actions
+            -- chargeClipped, charge requests served below the requested power, by the charging capacity or the battery space
+            -- socFull, charged vehicles that reached their battery capacity
+            -- socEmpty, discharged vehicles that reached an empty battery
+            -- socNegative, vehicles left with a negative battery volume after cruising, with drawn or given distances
+        ------------------------------------
+        '''
+        self.log_every = log_every
+        self.count_events = count_events
+        self.timers = {}        # phase -> [calls, total time, max time], unit: s
+        self.counters = dict.fromkeys(COUNTER_NAMES, 0)
+        self.steps = 0
+        self._wrapped = []      # (model, method name)
+
+    def attach(self, env):
+        '''Wrap the phase methods of the environment and of its models with timers
+        Methods already wrapped are skipped, so it can be called again once more models are created
+        '''
+        for modelName, name in ENV_PHASES:
+            model = env if modelName is None else getattr(env, modelName, None)
+            if model is None or name in vars(model) or not hasattr(model, name):
+                continue
+            phase = name if modelName is None else '{}.{}'.format(modelName, name)
+            if phase == 'fleet.chargeAndDischarge' and self.count_events:
+                wrapper = self._countedCharge(model, self._timed(phase, getattr(model, name)))
+            elif phase in ('fleet.cruise', 'fleet.drive') and self.count_events:
+                wrapper = self._countedCruise(model, self._timed(phase, getattr(model, name)))
+            elif phase == 'step':
+                wrapper = self._timedStep(getattr(model, name))
+            else:
+                wrapper = self._timed(phase, getattr(model, name))
+            setattr(model, name, wrapper)
+            self._wrapped.append((model, name))
+
+    def detach(self):
+        '''Restore the class methods of the instrumented models
+        '''
+        for model, name in self._wrapped:
+            delattr(model, name)
+        self._wrapped = []
+
+    def resetStats(self):
+        # Cleared in place, as the wrappers hold these dicts
+        self.timers.clear()
+        self.counters.update(dict.fromkeys(COUNTER_NAMES, 0))
+        self.steps = 0
+
+    def stats(self):
+        '''Statistics of each phase, unit: s, and the counters
+        '''
+        timers = {phase: {'calls': calls, 'total': total, 'mean': total/calls, 'max': maxTime}
+                  for phase, (calls, total, maxTime) in self.timers.items()}
+        return {'steps': self.steps, 'timers': timers, 'counters': dict(self.counters)}
+
+    def logLine(self):
+        '''One-line summary: mean time per call of each phase in microseconds and the non-zero counters
+        '''
+        phases = ' '.join('{}={:.1f}us'.format(phase, total/calls*1e6) for phase, (calls, total, _) in self.timers.items())
+        counters = ' '.join('{}={}'.format(name, value) for name, value in self.counters.items() if value)
+        return 'steps={} {} {}'.format(self.steps, phases, counters).rstrip()
+
+    def _timed(self, phase, method):
+        timers = self.timers
+        perf_counter = time.perf_counter
+
+        def timed(*args, **kwargs):
+            startTime = perf_counter()
+            result = method(*args, **kwargs)
+            elapsed = perf_counter()-startTime
+            timer = timers.get(phase)
+            if timer is None:
+                timers[phase] = [1, elapsed, elapsed]
+            else:
+                timer[0] += 1
+                timer[1] += elapsed
+                if elapsed > timer[2]:
+                    timer[2] = elapsed
+            return result
+        return timed
+
+    def _timedStep(self, method):
+        timedMethod = self._timed('step', method)
+
+        def step(actions):
+            result = timedMethod(actions)
+            self.steps += 1
+            if self.log_every and self.steps % self.log_every == 0:
+                logger.info(self.logLine())
+            return result
+        return step
+
+    def _countedCharge(self, fleet, method):
+        counters = self.counters
+
+        def chargeAndDischarge(actions, plantNum):
+            actions = np.asarray(actions, dtype=float)
+            charging = actions > 0
+            chargeable = charging & (np.minimum(np.minimum(actions, fleet.maxChargingCapacity), fleet.batteryCapacity-fleet.batteryVol) > 0)
+            realChargeRate, realDischargeRate = method(actions, plantNum)
+            dropped = chargeable & (realChargeRate == 0)
+            chargeableNum = chargeable.sum(axis=-1)
+            counters['chargerCapHits'] += int(np.count_nonzero(chargeableNum > plantNum))
+            counters['chargerCapDropped'] += int(dropped.sum())
+            counters['chargeRequests'] += int(charging.sum())
+            counters['chargeClipped'] += int((charging & ~dropped & (realChargeRate < actions)).sum())
+            counters['socFull'] += int(((realChargeRate > 0) & (fleet.batteryVol >= fleet.batteryCapacity*(1-1e-9))).sum())
+            counters['socEmpty'] += int(((realDischargeRate > 0) & (fleet.batteryVol <= fleet.batteryCapacity*1e-9)).sum())
+            return realChargeRate, realDischargeRate
+        return chargeAndDischarge
+
+    def _countedCruise(self, fleet, method):
+        counters = self.counters
+
+        def cruise(cruiseMask, *args):
+            method(cruiseMask, *args)
+            counters['socNegative'] += int((np.asarray(cruiseMask) & (fleet.batteryVol < 0)).sum())
+        return cruise
@@ -0,0 +1,144 @@
+import glob
+import os
+
+import gym
+import pandas as pd
+import numpy as np
+
+'''
+Trajectory recorder of BEVCommunity
+1. Each recorded step is one row of the state before the step, the action, the reward (grid load) and the comments of the step
+2. The rows are written into preallocated column buffers, which are flushed to one npz or parquet file per chunk,
+   so the memory stays constant over long multi-episode runs
+3. load_trajectory reads the chunk files back as one DataFrame
+'''
+
+COMMENT_NAMES = ['power_batteryCharge', 'power_batteryDischarge', 'totalVehicleCharge', 'totalVehicletoGrid']
+
+
+class TrajectoryRecorder(gym.Wrapper):
+
+    def __init__(self, env, out_dir, fields=None, decimation=1, chunkSize=8760, fmt='npz'):
+        '''Record the trajectory of a BEVCommunity environment
+        ------------------------------------
+        Args
+            -- env, BEVCommunity environment
+            -- out_dir, directory of the chunk files
+            -- fields, names of the recorded columns among env.obs_names, env.action_names, 'gridLoad' and the
+               comment names, or the groups 'obs', 'actions', 'comments', default all columns
+            -- decimation, record one step out of every decimation steps
+            -- chunkSize, number of rows written per chunk file
+            -- fmt, 'npz' or 'parquet' (requires pyarrow or fastparquet)
+        ------------------------------------
+        '''
+        super().__init__(env)
+        assert fmt in ('npz', 'parquet'), "The format needs to be npz or parquet"
+        self.out_dir = out_dir
+        self.decimation = decimation
+        self.chunkSize = chunkSize
+        self.fmt = fmt
+        os.makedirs(out_dir, exist_ok=True)
+
+        obs_names = list(self.env.obs_names)
+        action_names = list(self.env.action_names)
+        scalar_names = ['gridLoad'] + COMMENT_NAMES
+        if fields is None:
+            fields = ['obs', 'actions', 'gridLoad', 'comments']
+        fields = self._expandFields(fields, obs_names, action_names)
+        self.obsIdx = np.array([obs_names.index(name) for name in fields if name in obs_names], dtype=np.int64)
+        self.actionIdx = np.array([action_names.index(name) for name in fields if name in action_names], dtype=np.int64)
+        self.scalarIdx = np.array([scalar_names.index(name) for name in fields if name in scalar_names], dtype=np.int64)
+        self.obsColumns = [obs_names[idx] for idx in self.obsIdx]
+        self.actionColumns = [action_names[idx] for idx in self.actionIdx]
+        self.scalarColumns = [scalar_names[idx] for idx in self.scalarIdx]
+
+        # Preallocated column buffers, filled with copies of the recorded columns, reuse_obs is left as set by the caller
+        self.timeBuf = np.zeros((chunkSize, 2), dtype=np.int64)                  # episode, time step
+        self.obsBuf = np.zeros((chunkSize, self.obsIdx.size), dtype=np.float32)
+        self.actionBuf = np.zeros((chunkSize, self.actionIdx.size), dtype=np.float32)
+        self.scalarBuf = np.zeros((chunkSize, self.scalarIdx.size), dtype=float)
+        self._scalars = np.zeros(len(scalar_names))
+        self._lastObs = np.zeros(self.obsIdx.size, dtype=np.float32)
+        self.row = 0
+        self.chunk_idx = len(glob.glob(os.path.join(out_dir, 'chunk_*')))
+
+    def reset(self, **kwargs):
+        obs = self.env.reset(**kwargs)
+        self._lastObs[:] = obs[self.obsIdx]
+        return obs
+
+    def step(self, actions):
+        env = self.env.unwrapped
+        episode_idx, time_step_idx = env.episode_idx, env.time_step_idx
+        obs, reward, done, comments = self.env.step(actions)
+        if time_step_idx % self.decimation == 0:
+            row = self.row
+            self.timeBuf[row] = episode_idx, time_step_idx
+            self.obsBuf[row] = self._lastObs
+            self.actionBuf[row] = np.asarray(actions)[self.actionIdx]
+            self._scalars[0] = reward
+            self._scalars[1:] = comments[:4]
+            self.scalarBuf[row] = self._scalars[self.scalarIdx]
+            self.row += 1
+            if self.row == self.chunkSize:
+                self.flush()
+        self._lastObs[:] = obs[self.obsIdx]
+        return obs, reward, done, comments
+
+    def flush(self):
+        '''Write the buffered rows to a new chunk file
+        '''
+        if self.row == 0:
+            return
+        rows = self.row
+        path = os.path.join(self.out_dir, 'chunk_{:05d}.{}'.format(self.chunk_idx, self.fmt))
+        if self.fmt == 'npz':
+            np.savez(path, time=self.timeBuf[:rows], obs=self.obsBuf[:rows], actions=self.actionBuf[:rows], scalars=self.scalarBuf[:rows],
+                     obs_names=np.array(self.obsColumns, dtype=str), action_names=np.array(self.actionColumns, dtype=str),
+                     scalar_names=np.array(self.scalarColumns, dtype=str))
+        else:
+            self._toFrame(rows).to_parquet(path)
+        self.chunk_idx += 1
+        self.row = 0
+
+    def close(self):
+        self.flush()
+        return self.env.close()
+
+    def _toFrame(self, rows):
+        columns = {'episode': self.timeBuf[:rows, 0], 'time_step': self.timeBuf[:rows, 1]}
+        for buf, names in ((self.obsBuf, self.obsColumns), (self.actionBuf, self.actionColumns), (self.scalarBuf, self.scalarColumns)):
+            for col_i, name in enumerate(names):
+                columns[name] = buf[:rows, col_i]
+        return pd.DataFrame(columns)
+
+    @staticmethod
+    def _expandFields(fields, obs_names, action_names):
+        groups = {'obs': obs_names, 'actions': action_names, 'comments': COMMENT_NAMES}
+        expanded = []
+        for field in fields:
+            for name in groups.get(field, [field]):
+                assert name in obs_names or name in action_names or name in ['gridLoad'] + COMMENT_NAMES, "Unknown field: {}".format(name)
+                if name not in expanded:
+                    expanded.append(name)
+        return expanded
+
+
+def load_trajectory(out_dir):
+    '''Read the chunk files of a recorded trajectory as one DataFrame
+    Columns: episode, time_step and the recorded fields
+    '''
+    frames = []
+    for path in sorted(glob.glob(os.path.join(out_dir, 'chunk_*'))):
+        if path.endswith('.parquet'):
+            frames.append(pd.read_parquet(path))
+            continue
+        with np.load(path) as chunk:
+            columns = {'episode': chunk['time'][:, 0], 'time_step': chunk['time'][:, 1]}
+            for group, names in (('obs', 'obs_names'), ('actions', 'action_names'), ('scalars', 'scalar_names')):
+                for col_i, name in enumerate(chunk[names]):
+                    columns[str(name)] = chunk[group][:, col_i]
+            frames.append(pd.DataFrame(columns))
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,70 @@
+import numpy as np
+
+from policies import run_episode
+
+'''
+Ensembles of daily travel distance scenarios of BEVCommunity
+1. An ensemble holds K scenarios, an array (K, n_days, n_vehicles) drawn from independent random streams of one seed
+2. Ensembles are saved as npz files with the day types and the distance parameters they are drawn with,
+   so the same scenarios are reloaded to compare policies under common random numbers
+3. evaluate_policy runs a policy over every scenario of an ensemble from the same initial state
+'''
+
+
+def generate_scenarios(env, n_scenarios, seed=None):
+    '''Draw an ensemble of n_scenarios scenarios of the daily travel distances of a BEVCommunity environment
+    Scenario k only depends on the seed and k, so an ensemble can be extended without changing its first scenarios
+    '''
+    env = env.unwrapped
+    seedSeq = np.random.SeedSequence(seed)
+    return np.stack([env.sampleScenario(np.random.default_rng(childSeq)) for childSeq in seedSeq.spawn(n_scenarios)])
+
+
+def save_scenarios(path, scenarios, env, seed=None):
+    '''Save an ensemble with the day types and distance parameters of the environment it is drawn for
+    '''
+    fleet = env.unwrapped.fleet
+    np.savez(path, distances=scenarios, dayTypes=env.unwrapped.dayTypes, seed=-1 if seed is None else seed,
+             dist_mu_wd=fleet.dist_mu_wd, dist_sigma_wd=fleet.dist_sigma_wd, dist_mu_nwd=fleet.dist_mu_nwd, dist_sigma_nwd=fleet.dist_sigma_nwd)
+
+
+def load_scenarios(path, env=None):
+    '''Load an ensemble saved by save_scenarios
+    When an environment is given, check that the ensemble is drawn for the same calendar and vehicles
+    '''
+    with np.load(path) as ensemble:
+        scenarios = ensemble['distances']
+        if env is not None:
+            fleet = env.unwrapped.fleet
+            assert np.array_equal(ensemble['dayTypes'], env.unwrapped.dayTypes), "The scenarios are drawn for another calendar."
+            for name in ['dist_mu_wd', 'dist_sigma_wd', 'dist_mu_nwd', 'dist_sigma_nwd']:
+                assert np.array_equal(ensemble[name], getattr(fleet, name)), "The scenarios are drawn for other vehicles."
+    return scenarios
+
+
+def evaluate_policy(env, policy, scenarios):
+    '''Run one episode of a policy for each scenario of an ensemble, all starting from the current state of the environment
+    The state and the travel distances of the environment are left as they were
+    ------------------------------------
+    Args
+        -- env, BEVCommunity environment
+        -- policy, policy(obs, preAction, hour) -> action array, see policies
+        -- scenarios, array (K, n_days, n_vehicles) of daily travel distances
+    ------------------------------------
+    Output
+        -- dict of arrays: gridLoad (K, n_steps) and comments (K, n_steps, 4)
+    '''
+    env = env.unwrapped
+    initialState = env.get_state(include_rng=False)
+    distances = env.distances
+    results = {'gridLoad': np.empty((len(scenarios), env.n_steps)), 'comments': np.empty((len(scenarios), env.n_steps, 4))}
+    try:
+        for scenario_i, scenario in enumerate(scenarios):
+            env.set_state(initialState)
+            episode = run_episode(env, policy, scenario=scenario)
+            results['gridLoad'][scenario_i] = episode['gridLoad']
+            results['comments'][scenario_i] = episode['comments']
+    finally:
+        env.set_state(initialState)
+        env.distances = distances
+    return results
@@ -0,0 +1,435 @@
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import json
+import socket
+import struct
+import sys
+import threading
+import time
+
+import gym
+from gym import spaces
+import numpy as np
+
+from BEVCommunity import BEVCommunity
+
+'''
+Local server of a pool of BEVCommunity environments
+1. The environments are built once by the server, clients on a Unix-domain or TCP socket lease some of them
+   and send batched reset/step requests over the leased environments
+2. A message is a fixed binary header followed by raw array bytes, the arrays are read with np.frombuffer,
+   without pickling nor copying
+3. The requests of all clients go through one bounded queue, a full queue stops the server from reading the sockets,
+   so the clients are slowed down instead of piling up requests
+4. The queued requests are executed one batch at a time in a worker thread, so the event loop keeps accepting clients,
+   reading their requests and writing the replies while the environments are stepped
+5. The server counts the requests and environment steps, and keeps the latencies of the recent requests, from arrival to reply
+6. BatchClient steps its leased environments in one request, EnvClient is a gym environment proxying one leased environment
+'''
+
+# Message header: operation, number of environments (or of leased environments), payload length in bytes
+HEADER = struct.Struct('<B3xII')
+OP_INFO, OP_LEASE, OP_RELEASE, OP_RESET, OP_STEP, OP_METRICS = range(6)
+OP_ERROR = 255
+COMMENT_NUM = 4
+
+
+def _raw(array):
+    '''Bytes of an array as a flat memoryview, without copy for a C-contiguous array
+    '''
+    return memoryview(np.ascontiguousarray(array)).cast('B')
+
+
+class EnvServer:
+
+    def __init__(self, env_kwargs, pool_size=1, max_pending=64, max_batch=32, latency_window=10000):
+        '''Server of a pool of BEVCommunity environments
+        ------------------------------------
+        Args
+            -- env_kwargs, dict of the BEVCommunity arguments, building_list, re_list, vehicle_list, battery_info, powerplant_num
+               and optionally the other keyword arguments
+            -- pool_size, number of environments of the pool
+            -- max_pending, maximum number of queued requests, beyond which the server stops reading the client sockets
+            -- max_batch, maximum number of queued requests served in one pass of the event loop
+            -- latency_window, number of recent requests kept for the latency percentiles
+        ------------------------------------
+        '''
+        # The input files are parsed by the first environment, the others take them from the profile cache
+        self.envs = [BEVCommunity(reuse_obs=True, **env_kwargs) for _ in range(pool_size)]
+        env = self.envs[0]
+        self.obs_dim = len(env.obs_names)
+        self.action_dim = len(env.action_names)
+        self.max_pending = max_pending
+        self.max_batch = max_batch
+        self.info = json.dumps({'pool_size': pool_size, 'obs_dim': self.obs_dim, 'action_dim': self.action_dim, 'n_steps': env.n_steps,
+                                'obs_names': env.obs_names, 'action_names': env.action_names,
+                                'obs_low': env.obs_low.tolist(), 'obs_high': env.obs_high.tolist(),
+                                'actions_low': env.actions_low.tolist(), 'actions_high': env.actions_high.tolist()}).encode()
+
+        self._free = collections.deque(range(pool_size))
+        self._latencies = collections.deque(maxlen=latency_window)
+        self._counts = dict.fromkeys(['requests', 'envSteps', 'envResets', 'batches', 'errors', 'maxQueueDepth', 'clients'], 0)
+        self._startTime = time.perf_counter()
+        self._queue = None
+        self._server = None
+        self._worker = None
+        self._executor = None
+        self._loop = None
+        self._thread = None
+        self.address = None
+
+    async def start(self, address):
+        '''Start serving on a Unix-domain socket path, or on a (host, port) TCP address, port 0 for any free port
+        Return the address the server listens on
+        '''
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='EnvServer')
+        if isinstance(address, str):
+            self._server = await asyncio.start_unix_server(self._onClient, path=address)
+            self.address = address
+        else:
+            self._server = await asyncio.start_server(self._onClient, address[0], address[1])
+            self.address = self._server.sockets[0].getsockname()[:2]
+        self._worker = asyncio.ensure_future(self._serveQueue())
+        self._startTime = time.perf_counter()
+        return self.address
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._worker.cancel()
+            self._executor.shutdown()
+            self._server = None
+
+    def run(self, address):
+        '''Serve until interrupted
+        '''
+        async def serve():
+            await self.start(address)
+            try:
+                await self._server.serve_forever()
+            finally:
+                await self.close()
+        asyncio.run(serve())
+
+    def start_in_thread(self, address):
+        '''Serve from a daemon thread with its own event loop, e.g. for clients in the same process, return the address
+        '''
+        started = threading.Event()
+
+        def serve():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(self.start(address))
+            started.set()
+            loop.run_forever()
+            loop.run_until_complete(self.close())
+            loop.close()
+
+        self._thread = threading.Thread(target=serve, daemon=True)
+        self._thread.start()
+        started.wait()
+        return self.address
+
+    def stop(self):
+        '''Stop a server started by start_in_thread
+        '''
+        if self._thread is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._thread = None
+
+    def metrics(self):
+        '''Request and environment step counts and rates, batch sizes, latencies of the recent requests (unit: s)
+        and the state of the queue and of the pool
+        '''
+        metrics = dict(self._counts)
+        uptime = time.perf_counter()-self._startTime
+        latencies = np.array(self._latencies)
+        metrics.update({'uptime': uptime, 'requestsPerSecond': metrics['requests']/uptime, 'stepsPerSecond': metrics['envSteps']/uptime,
+                        'meanBatchSize': metrics['requests']/max(metrics['batches'], 1),
+                        'queueDepth': 0 if self._queue is None else self._queue.qsize(),
+                        'leased': len(self.envs)-len(self._free)})
+        if latencies.size:
+            metrics.update({'latencyMean': float(latencies.mean()), 'latencyP50': float(np.percentile(latencies, 50)),
+                            'latencyP99': float(np.percentile(latencies, 99)), 'latencyMax': float(latencies.max())})
+        return metrics
+
+    async def _onClient(self, reader, writer):
+        '''Read the requests of one client, queue them and write back the replies in order
+        The environments leased by the client are released when it disconnects
+        '''
+        leased = set()
+        self._counts['clients'] += 1
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(HEADER.size)
+                    op, count, length = HEADER.unpack(header)
+                    payload = await reader.readexactly(length)
+                except asyncio.IncompleteReadError:
+                    break
+                arrivalTime = time.perf_counter()
+                reply = self._loop.create_future()
+                # Wait here when the queue is full, the socket of the client is not read meanwhile
+                await self._queue.put((op, count, payload, leased, reply))
+                self._counts['maxQueueDepth'] = max(self._counts['maxQueueDepth'], self._queue.qsize())
+                op, count, buffers = await reply
+                writer.writelines([HEADER.pack(op, count, sum(len(buffer) for buffer in buffers))] + buffers)
+                await writer.drain()
+                self._latencies.append(time.perf_counter()-arrivalTime)
+        except ConnectionError:
+            pass
+        finally:
+            self._counts['clients'] -= 1
+            self._free.extend(sorted(leased))
+            writer.close()
+
+    async def _serveQueue(self):
+        '''Serve the queued requests, all requests queued meanwhile are served in one batch
+        '''
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            self._counts['batches'] += 1
+            results = await self._loop.run_in_executor(self._executor, self._executeBatch, batch)
+            for (_, _, _, _, reply), result in zip(batch, results):
+                if not reply.cancelled():
+                    reply.set_result(result)
+            # Let the client handlers write the replies and read the next requests
+            await asyncio.sleep(0)
+
+    def _executeBatch(self, batch):
+        '''Execute a batch of requests in the worker thread, a failed request gets an error reply
+        '''
+        results = []
+        for op, count, payload, leased, _ in batch:
+            try:
+                results.append(self._execute(op, count, payload, leased))
+            except Exception as exception:
+                self._counts['errors'] += 1
+                results.append((OP_ERROR, 0, [str(exception).encode()]))
+            self._counts['requests'] += 1
+        return results
+
+    def _execute(self, op, count, payload, leased):
+        if op == OP_INFO:
+            return OP_INFO, 0, [self.info]
+        elif op == OP_METRICS:
+            return OP_METRICS, 0, [json.dumps(self.metrics()).encode()]
+        elif op == OP_LEASE:
+            if count > len(self._free):
+                raise ValueError("Only {} of the {} environments are free.".format(len(self._free), len(self.envs)))
+            envIds = np.array([self._free.popleft() for _ in range(count)], dtype=np.uint32)
+            leased.update(envIds.tolist())
+            return OP_LEASE, count, [_raw(envIds)]
+        elif op == OP_RELEASE:
+            envIds = self._leasedIds(payload, count, 0, leased)
+            leased.difference_update(envIds.tolist())
+            self._free.extend(envIds.tolist())
+            return OP_RELEASE, count, []
+        elif op == OP_RESET:
+            # Payload: seeds int64 (count,), -1 for no seed, environment ids uint32 (count,)
+            if len(payload) != count*12:
+                raise ValueError("A reset request needs one seed and one environment id per environment.")
+            seeds = np.frombuffer(payload, dtype=np.int64, count=count)
+            envIds = self._leasedIds(payload, count, 8*count, leased)
+            obs = np.empty((count, self.obs_dim), dtype=np.float32)
+            for env_i, (env_id, seed) in enumerate(zip(envIds, seeds)):
+                obs[env_i] = self.envs[env_id].reset(seed=None if seed < 0 else int(seed))
+            self._counts['envResets'] += count
+            return OP_RESET, count, [_raw(obs)]
+        elif op == OP_STEP:
+            # Payload: actions float64 (count, action_dim), environment ids uint32 (count,)
+            if len(payload) != count*(8*self.action_dim+4):
+                raise ValueError("A step request needs {} actions and one environment id per environment.".format(self.action_dim))
+            actions = np.frombuffer(payload, dtype=np.float64, count=count*self.action_dim).reshape(count, self.action_dim)
+            envIds = self._leasedIds(payload, count, 8*count*self.action_dim, leased)
+            finished = [int(env_id) for env_id in envIds if self.envs[env_id].time_step_idx >= self.envs[env_id].n_steps]
+            if finished:
+                raise ValueError("The episodes of the environments {} are finished, a reset is required.".format(finished))
+            rewards = np.empty(count)
+            comments = np.empty((count, COMMENT_NUM))
+            obs = np.empty((count, self.obs_dim), dtype=np.float32)
+            dones = np.empty(count, dtype=np.uint8)
+            for env_i, env_id in enumerate(envIds):
+                obs[env_i], rewards[env_i], dones[env_i], comments[env_i] = self.envs[env_id].step(actions[env_i])
+            self._counts['envSteps'] += count
+            # Reply: rewards float64 (count,), comments float64 (count, 4), states float32 (count, obs_dim), dones uint8 (count,)
+            return OP_STEP, count, [_raw(rewards), _raw(comments), _raw(obs), _raw(dones)]
+        raise ValueError("Unknown operation {}.".format(op))
+
+    def _leasedIds(self, payload, count, offset, leased):
+        if len(payload) != offset+4*count:
+            raise ValueError("The request needs one environment id per environment.")
+        envIds = np.frombuffer(payload, dtype=np.uint32, count=count, offset=offset)
+        if not leased.issuperset(envIds.tolist()):
+            raise ValueError("The environments {} are not leased by this client.".format(sorted(set(envIds.tolist())-leased)))
+        if len(set(envIds.tolist())) < count:
+            raise ValueError("The environments of a request need to be distinct.")
+        return envIds
+
+
+class _Connection:
+
+    def __init__(self, address, timeout=None):
+        '''Blocking connection to an EnvServer, on a Unix-domain socket path or a (host, port) TCP address
+        '''
+        if isinstance(address, str):
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.settimeout(timeout)
+        self.sock.connect(address if isinstance(address, str) else tuple(address))
+
+    def request(self, op, count=0, buffers=()):
+        '''Send a request and wait for its reply, return the count and the payload of the reply
+        The payload is a new buffer for each reply, so the arrays read from it stay valid
+        '''
+        parts = [HEADER.pack(op, count, sum(len(buffer) for buffer in buffers))] + list(buffers)
+        sent = self.sock.sendmsg(parts)
+        total = sum(len(part) for part in parts)
+        if sent < total:
+            self.sock.sendall(b''.join(parts)[sent:])
+
+        op, count, length = HEADER.unpack(self._receive(HEADER.size))
+        payload = self._receive(length)
+        if op == OP_ERROR:
+            raise RuntimeError("Environment server error: {}".format(bytes(payload).decode()))
+        return count, payload
+
+    def _receive(self, length):
+        payload = bytearray(length)
+        view = memoryview(payload)
+        received = 0
+        while received < length:
+            n = self.sock.recv_into(view[received:])
+            if n == 0:
+                raise ConnectionError("The environment server closed the connection.")
+            received += n
+        return payload
+
+    def close(self):
+        self.sock.close()
+
+
+class BatchClient:
+
+    def __init__(self, address, n_envs=1, timeout=None):
+        '''Client leasing n_envs environments of an EnvServer, reset and stepped together in one request
+        ------------------------------------
+        Args
+            -- address, Unix-domain socket path or (host, port) TCP address of the server
+            -- n_envs, number of leased environments
+            -- timeout, socket timeout, unit: s, None to wait forever
+        ------------------------------------
+        '''
+        self.connection = _Connection(address, timeout)
+        try:
+            self.info = json.loads(bytes(self.connection.request(OP_INFO)[1]))
+            self.n_envs = n_envs
+            self.obs_dim = self.info['obs_dim']
+            self.action_dim = self.info['action_dim']
+            self.n_steps = self.info['n_steps']
+            self.envIds = np.frombuffer(self.connection.request(OP_LEASE, n_envs)[1], dtype=np.uint32)
+        except BaseException:
+            # Do not leak the socket when the lease fails
+            self.connection.close()
+            self.connection = None
+            raise
+
+    def reset(self, seeds=None):
+        '''Reset the leased environments, seeds is an array (n_envs,) of seeds, negative for no seed, see BEVCommunity.reset
+        Return: the states (n_envs, obs_dim)
+        '''
+        seeds = np.full(self.n_envs, -1, dtype=np.int64) if seeds is None else np.asarray(seeds, dtype=np.int64)
+        _, payload = self.connection.request(OP_RESET, self.n_envs, [_raw(seeds), _raw(self.envIds)])
+        return np.frombuffer(payload, dtype=np.float32).reshape(self.n_envs, self.obs_dim)
+
+    def step(self, actions):
+        '''Step the leased environments with an action array (n_envs, action_dim)
+        Return: states (n_envs, obs_dim), rewards (n_envs,), dones (n_envs,), comments (n_envs, 4)
+        '''
+        actions = np.asarray(actions, dtype=np.float64)
+        if actions.shape != (self.n_envs, self.action_dim):
+            raise ValueError("Actions need to be of shape (n_envs, n_vehicles) = ({}, {})".format(self.n_envs, self.action_dim))
+        _, payload = self.connection.request(OP_STEP, self.n_envs, [_raw(actions), _raw(self.envIds)])
+        n = self.n_envs
+        rewards = np.frombuffer(payload, dtype=np.float64, count=n)
+        comments = np.frombuffer(payload, dtype=np.float64, count=n*COMMENT_NUM, offset=8*n).reshape(n, COMMENT_NUM)
+        obs = np.frombuffer(payload, dtype=np.float32, count=n*self.obs_dim, offset=8*n*(1+COMMENT_NUM)).reshape(n, self.obs_dim)
+        dones = np.frombuffer(payload, dtype=np.uint8, count=n, offset=8*n*(1+COMMENT_NUM)+4*n*self.obs_dim).astype(bool)
+        return obs, rewards, dones, comments
+
+    def metrics(self):
+        return json.loads(bytes(self.connection.request(OP_METRICS)[1]))
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.request(OP_RELEASE, self.n_envs, [_raw(self.envIds)])
+            except (OSError, RuntimeError):
+                pass
+            self.connection.close()
+            self.connection = None
+
+
+class EnvClient(gym.Env):
+
+    def __init__(self, address, timeout=None):
+        '''Gym environment proxying one environment leased from an EnvServer, with the states, rewards and comments of BEVCommunity
+        '''
+        super().__init__()
+        self.client = BatchClient(address, 1, timeout)
+        info = self.client.info
+        self.n_steps = info['n_steps']
+        self.obs_names = info['obs_names']
+        self.action_names = info['action_names']
+        self.action_space = spaces.Box(low=np.array(info['actions_low']), high=np.array(info['actions_high']), dtype=np.float32)
+        self.observation_space = spaces.Box(low=np.array(info['obs_low']), high=np.array(info['obs_high']), dtype=np.float32)
+
+    def reset(self, seed=None):
+        return self.client.reset(None if seed is None else [seed])[0]
+
+    def step(self, actions):
+        obs, rewards, dones, comments = self.client.step(np.asarray(actions, dtype=np.float64)[None])
+        return obs[0], float(rewards[0]), bool(dones[0]), tuple(comments[0])
+
+    def metrics(self):
+        return self.client.metrics()
+
+    def close(self):
+        self.client.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve a pool of BEVCommunity environments on a local socket')
+    parser.add_argument('config', help='json file of the BEVCommunity arguments')
+    parser.add_argument('--unix', default=None, help='path of the Unix-domain socket, default a TCP socket')
+    parser.add_argument('--host', default='127.0.0.1', help='host of the TCP socket')
+    parser.add_argument('--port', type=int, default=5555, help='port of the TCP socket')
+    parser.add_argument('--pool-size', type=int, default=1, help='number of environments of the pool')
+    parser.add_argument('--max-pending', type=int, default=64, help='maximum number of queued requests')
+    parser.add_argument('--max-batch', type=int, default=32, help='maximum number of requests served in one batch')
+    args = parser.parse_args(argv)
+
+    with open(args.config) as configFile:
+        env_kwargs = json.load(configFile)
+    server = EnvServer(env_kwargs, args.pool_size, args.max_pending, args.max_batch)
+    address = args.unix if args.unix is not None else (args.host, args.port)
+    print('Serving {} environments on {}'.format(args.pool_size, address), file=sys.stderr)
+    try:
+        server.run(address)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,209 @@
+import argparse
+import hashlib
+import importlib
+import itertools
+import json
+import os
+import pickle
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from multiprocessing import shared_memory
+
+import pandas as pd
+import numpy as np
+
+from BEVCommunity import BEVCommunity
+from cache import profileCache
+from policies import run_episode
+
+'''
+Scenario sweep of BEVCommunity over a process pool
+1. Every unique building/renewable profile is parsed once by the parent process and shared with the workers through shared memory
+2. Each worker runs whole episodes and writes the results of each time step of a scenario to <out_dir>/<scenario id>.npz
+3. Scenarios with an existing result file are skipped, so an interrupted sweep is resumed by running it again,
+   the scenario id covers the content of the input files, the policy and the environment arguments,
+   so a changed input or policy is run again
+4. The travel distances and the global random generator of each scenario are seeded from its id, see scenario_seed,
+   so a scenario gives the same results whichever worker runs it and in whichever order
+'''
+
+SCENARIO_KEYS = ('building_list', 're_list', 'vehicle_list', 'battery_info', 'powerplant_num')
+
+# Profiles attached by each worker process, csv file -> profile
+_sharedProfiles = {}
+_sharedBlock = None
+
+
+def idle_policy(obs, preAction, hour):
+    '''Charging policy that never charges nor discharges the vehicles
+    A charging policy maps the state array, the previous action array and the hour of the day to the action array
+    '''
+    return np.zeros_like(preAction)
+
+
+def scenario_grid(**options):
+    '''Build the scenarios of all combinations of the given options
+    example: scenario_grid(building_list=[...], re_list=[...], vehicle_list=[...], battery_info=[...], powerplant_num=[10, 20])
+    '''
+    for key in options:
+        assert key in SCENARIO_KEYS, "Unknown scenario option: {}".format(key)
+    keys = list(options)
+    return [dict(zip(keys, values)) for values in itertools.product(*[options[key] for key in keys])]
+
+
+def scenario_id(scenario, policy=idle_policy, env_kwargs=None):
+    '''Identifier of a run of a scenario, derived from the content of its input files, its other arguments,
+    the picklable policy and the other keyword arguments of BEVCommunity
+    '''
+    content = {'building_list': [(profileCache.fileHash(csv_file), number) for csv_file, number in scenario['building_list']],
+               're_list': [(profileCache.fileHash(csv_file), number) for csv_file, number in scenario['re_list']],
+               'vehicle_list': [profileCache.fileHash(scenario['vehicle_list'][0])] +
+                               [(profileCache.fileHash(csv_file), number) for csv_file, number in scenario['vehicle_list'][1:]],
+               'battery_info': profileCache.fileHash(scenario['battery_info']),
+               'powerplant_num': scenario['powerplant_num'],
+               'policy': hashlib.sha1(pickle.dumps(policy)).hexdigest(),
+               'env_kwargs': env_kwargs or {}}
+    return hashlib.sha1(json.dumps(content, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def scenario_seed(scenarioId):
+    '''Seed of the random generators of a scenario run, derived from its scenario id
+    '''
+    return int(scenarioId[:8], 16)
+
+
+def run_sweep(scenarios, policy=idle_policy, out_dir='sweep_results', n_workers=None, max_pending=None, env_kwargs=None):
+    '''Run an episode of each scenario over a process pool
+    ------------------------------------
+    Args
+        -- scenarios, list of dicts with the BEVCommunity arguments building_list, re_list, vehicle_list, battery_info, powerplant_num
+        -- policy, picklable charging policy, see idle_policy
+        -- out_dir, directory of the result files
+        -- n_workers, number of worker processes, default os.cpu_count()
+        -- max_pending, maximum number of scenarios submitted to the pool at once, default 2*n_workers
+        -- env_kwargs, other keyword arguments of BEVCommunity shared by all scenarios, e.g. stepLenth and horizon
+    ------------------------------------
+    Output
+        -- generator of the summary dict of each scenario, in the order the scenarios finish
+    '''
+    n_workers = n_workers or os.cpu_count()
+    max_pending = max_pending or 2*n_workers
+    os.makedirs(out_dir, exist_ok=True)
+
+    todo = []
+    for scenario in scenarios:
+        scenarioId = scenario_id(scenario, policy, env_kwargs)
+        if not os.path.exists(os.path.join(out_dir, scenarioId+'.npz')):
+            todo.append((scenarioId, scenario))
+    if not todo:
+        return
+
+    # Parse each profile once into one shared memory block, the profiles are hourly or finer so their lengths differ
+    csvFiles = sorted({profile[0] for _, scenario in todo for key in ('building_list', 're_list') for profile in scenario[key]})
+    loads = [pd.read_csv(csv_file, index_col=0).iloc[:, 0].values.astype(float) for csv_file in csvFiles]
+    offsets = np.concatenate([[0], np.cumsum([len(load) for load in loads])]).tolist()
+    block = shared_memory.SharedMemory(create=True, size=max(offsets[-1], 1)*8)
+    try:
+        profiles = np.ndarray((offsets[-1],), dtype=float, buffer=block.buf)
+        for csv_i, load in enumerate(loads):
+            profiles[offsets[csv_i]:offsets[csv_i+1]] = load
+        del profiles, loads
+
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_attachProfiles, initargs=(block.name, csvFiles, offsets)) as pool:
+            pending = set()
+            todo = iter(todo)
+            while True:
+                for scenarioId, scenario in itertools.islice(todo, max_pending-len(pending)):
+                    pending.add(pool.submit(_runScenario, scenarioId, scenario, policy, out_dir, env_kwargs))
+                if not pending:
+                    break
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    summary = future.result()
+                    with open(os.path.join(out_dir, 'summary.jsonl'), 'a') as summaryFile:
+                        summaryFile.write(json.dumps(summary)+'\n')
+                    yield summary
+    finally:
+        block.close()
+        block.unlink()
+
+
+def _attachProfiles(blockName, csvFiles, offsets):
+    '''Worker initializer, attach the shared profiles, profile i is at offsets[i]:offsets[i+1] of the block
+    '''
+    global _sharedBlock
+    _sharedBlock = shared_memory.SharedMemory(name=blockName)
+    profiles = np.ndarray((offsets[-1],), dtype=float, buffer=_sharedBlock.buf)
+    profiles.setflags(write=False)
+    for csv_i, csv_file in enumerate(csvFiles):
+        _sharedProfiles[csv_file] = profiles[offsets[csv_i]:offsets[csv_i+1]]
+
+
+def _runScenario(scenarioId, scenario, policy, out_dir, env_kwargs=None):
+    '''Run an episode of one scenario in a worker and save the results of each time step
+    '''
+    startTime = time.perf_counter()
+    seed = scenario_seed(scenarioId)
+    summary = {'scenario_id': scenarioId, 'scenario': scenario, 'seed': seed}
+    try:
+        building_list = [(_sharedProfiles.get(csv_file, csv_file), number) for csv_file, number in scenario['building_list']]
+        re_list = [(_sharedProfiles.get(csv_file, csv_file), number) for csv_file, number in scenario['re_list']]
+        env = BEVCommunity(building_list, re_list, scenario['vehicle_list'], scenario['battery_info'], scenario['powerplant_num'],
+                           **(env_kwargs or {}))
+
+        env.seed(seed)
+        results = run_episode(env, policy, seed=seed)
+        gridLoad, comments = results['gridLoad'], results['comments']
+
+        step_h = env.stepLenth/3600
+        resultFile = os.path.join(out_dir, scenarioId+'.npz')
+        np.savez(resultFile+'.tmp.npz', gridLoad=gridLoad, comments=comments, seed=seed)
+        os.replace(resultFile+'.tmp.npz', resultFile)
+        summary.update({
+            'gridImport': float(gridLoad[gridLoad > 0].sum()*step_h),          # unit: kWh
+            'gridExport': float(-gridLoad[gridLoad < 0].sum()*step_h),         # unit: kWh
+            'peakImport': float(gridLoad.max()),                               # unit: kW
+            'vehicleCharge': float(comments[:, 2].sum()*step_h),               # unit: kWh
+        })
+    except Exception as exception:
+        summary['error'] = repr(exception)
+    summary['runtime'] = time.perf_counter()-startTime
+    return summary
+
+
+def _loadPolicy(policyPath):
+    '''Import a policy given as module:attribute, a class is instantiated with its default arguments
+    '''
+    moduleName, attrName = policyPath.split(':')
+    policy = getattr(importlib.import_module(moduleName), attrName)
+    return policy() if isinstance(policy, type) else policy
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a scenario sweep of BEVCommunity over a process pool')
+    parser.add_argument('scenarios', help='json file, a list of scenarios or {"grid": {option: [values]}}')
+    parser.add_argument('--policy', default='sweep:idle_policy', help='charging policy as module:attribute')
+    parser.add_argument('--out-dir', default='sweep_results', help='directory of the result files')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--max-pending', type=int, default=None, help='maximum number of scenarios submitted at once')
+    parser.add_argument('--env-kwargs', default=None, help='json of the other keyword arguments of BEVCommunity, e.g. {"stepLenth": 900}')
+    args = parser.parse_args(argv)
+
+    with open(args.scenarios) as scenarioFile:
+        scenarios = json.load(scenarioFile)
+    if isinstance(scenarios, dict):
+        scenarios = scenario_grid(**scenarios['grid'])
+    policy = _loadPolicy(args.policy)
+
+    env_kwargs = None if args.env_kwargs is None else json.loads(args.env_kwargs)
+    for summary in run_sweep(scenarios, policy, args.out_dir, args.workers, args.max_pending, env_kwargs):
+        if 'error' in summary:
+            print('{}: failed, {}'.format(summary['scenario_id'], summary['error']), file=sys.stderr)
+        else:
+            print('{}: grid import {:.2f} kWh, peak import {:.2f} kW, {:.1f} s'.format(
+                summary['scenario_id'], summary['gridImport'], summary['peakImport'], summary['runtime']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+from collections import OrderedDict
+
+import numpy as np
+
+'''
+Lazy time series of the simulation time steps
+1. The source profile covers one year (8760 hours) at its own resolution, e.g. hourly or 15 minutes
+2. The profile repeats every year, so the horizon can span several years
+3. The values of the time steps are linearly interpolated from the source profile chunk by chunk on first access,
+   only a few chunks are kept in memory
+'''
+
+YEAR_SECONDS = 8760*3600
+
+
+class TimeSeriesProvider:
+
+    def __init__(self, source, stepLenth, n_steps, chunkSize=8760, maxChunks=4):
+        '''Values of a periodic source profile at each time step
+        ------------------------------------
+        Args
+            -- source, array of one year of values, e.g. a memory-mapped array from the profile cache
+            -- stepLenth, lenth of each time step, unit: s
+            -- n_steps, number of time steps of the horizon
+            -- chunkSize, number of time steps interpolated at once
+            -- maxChunks, number of interpolated chunks kept in memory
+        ------------------------------------
+        '''
+        assert YEAR_SECONDS % len(source) == 0, "The source profile needs to cover one year at a whole-second resolution."
+        self.source = source
+        self.sourceStep = YEAR_SECONDS//len(source)     # unit: s
+        self.stepLenth = stepLenth
+        self.n_steps = n_steps
+        self.chunkSize = chunkSize
+        self.maxChunks = maxChunks
+        self._chunks = OrderedDict()
+        self._lastChunkIdx, self._lastChunk = None, None
+
+    def __len__(self):
+        return self.n_steps
+
+    def __getitem__(self, idx):
+        '''Value of a time step, or an array of values for a slice or an array of time steps
+        '''
+        if isinstance(idx, slice):
+            return self.interpolate(np.arange(*idx.indices(self.n_steps)))
+        if np.ndim(idx):
+            idx = np.asarray(idx)
+            if np.any((idx < 0) | (idx >= self.n_steps)):
+                raise IndexError("Time step out of the horizon")
+            chunkIdx = idx // self.chunkSize
+            if idx.size and np.all(chunkIdx == chunkIdx[0]):
+                return self.chunk(int(chunkIdx[0]))[idx - chunkIdx[0]*self.chunkSize]
+            return self.interpolate(idx)
+        if idx < 0:
+            idx += self.n_steps
+        if not 0 <= idx < self.n_steps:
+            raise IndexError("Time step out of the horizon")
+        chunkIdx, stepIdx = divmod(int(idx), self.chunkSize)
+        if chunkIdx == self._lastChunkIdx:
+            return self._lastChunk[stepIdx]
+        return self.chunk(chunkIdx)[stepIdx]
+
+    def __array__(self, dtype=None):
+        return np.asarray(self[:], dtype=dtype)
+
+    def chunk(self, chunkIdx):
+        '''Interpolated values of a chunk of time steps, kept in a small LRU cache
+        '''
+        if chunkIdx in self._chunks:
+            self._chunks.move_to_end(chunkIdx)
+            values = self._chunks[chunkIdx]
+        else:
+            steps = np.arange(chunkIdx*self.chunkSize, min((chunkIdx+1)*self.chunkSize, self.n_steps))
+            values = self.interpolate(steps)
+            values.setflags(write=False)
+            self._chunks[chunkIdx] = values
+            if len(self._chunks) > self.maxChunks:
+                self._chunks.popitem(last=False)
+        self._lastChunkIdx, self._lastChunk = chunkIdx, values
+        return values
+
+    def interpolate(self, steps):
+        '''Linearly interpolate the source profile at the start of the given time steps
+        The profile wraps around at the end of the year
+        '''
+        seconds = (np.asarray(steps, dtype=np.int64)*self.stepLenth) % YEAR_SECONDS
+        sourceIdx, offset = np.divmod(seconds, self.sourceStep)
+        values = np.asarray(self.source[sourceIdx], dtype=float)
+        between = offset != 0
+        if between.any():
+            value0 = values[between]
+            value1 = np.asarray(self.source[(sourceIdx[between]+1) % len(self.source)], dtype=float)
+            values[between] = value0 + (value1-value0)*(offset[between]/self.sourceStep)
+        return values
+
+    @classmethod
+    def combine(cls, providers, weights, stepLenth, n_steps):
+        '''Weighted sum of providers, the sources of the same resolution are summed before interpolation
+        Return a TimeSeriesProvider, or a TimeSeriesSum when the sources have different resolutions
+        '''
+        sources = OrderedDict()
+        for provider, weight in zip(providers, weights):
+            if provider.sourceStep in sources:
+                sources[provider.sourceStep] = sources[provider.sourceStep] + provider.source*weight
+            else:
+                sources[provider.sourceStep] = np.zeros(len(provider.source)) + provider.source*weight
+        if not sources:
+            sources[3600] = np.zeros(8760)
+        combined = [cls(source, stepLenth, n_steps) for source in sources.values()]
+        return combined[0] if len(combined) == 1 else TimeSeriesSum(combined)
+
+
+class TimeSeriesSum:
+
+    def __init__(self, providers):
+        '''Sum of time series of different source resolutions
+        '''
+        self.providers = providers
+        self.n_steps = providers[0].n_steps
+
+    def __len__(self):
+        return self.n_steps
+
+    def __getitem__(self, idx):
+        total = self.providers[0][idx]
+        for provider in self.providers[1:]:
+            total = total + provider[idx]
+        return total
+
+    def __array__(self, dtype=None):
+        return np.asarray(self[:], dtype=dtype)
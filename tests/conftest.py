@@ -0,0 +1,65 @@
+import collections
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# The environment modules import each other by their top-level names
+ENVS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'gym_BEVPro', 'envs')
+INPUT_DIR = os.path.join(ENVS_DIR, 'inputs')
+sys.path.insert(0, ENVS_DIR)
+
+
+def input_file(name):
+    return os.path.join(INPUT_DIR, name)
+
+
+@pytest.fixture(autouse=True)
+def profile_cache(tmp_path, monkeypatch):
+    '''Profile cache of each test in its own directory, the cache of the user is left untouched
+    '''
+    from cache import profileCache
+    cache_dir = str(tmp_path/'bevpro_cache')
+    os.makedirs(cache_dir)
+    monkeypatch.setenv('BEVPRO_CACHE_DIR', cache_dir)
+    monkeypatch.setattr(profileCache, 'cache_dir', cache_dir)
+    monkeypatch.setattr(profileCache, '_memory', collections.OrderedDict())
+    monkeypatch.setattr(profileCache, '_hashes', {})
+    return profileCache
+
+
+@pytest.fixture
+def community_kwargs():
+    '''Arguments of a small community of 10 vehicles, as in Simulation.ipynb
+    '''
+    return dict(building_list=[(input_file('building{}.csv'.format(i)), 10) for i in (1, 2, 3)],
+                re_list=[(input_file('renewable{}.csv'.format(i)), 10) for i in (1, 2, 3)],
+                vehicle_list=[input_file('vehicle_atHomeSchd.csv'), (input_file('vehicle1.csv'), 4),
+                              (input_file('vehicle2.csv'), 3), (input_file('vehicle3.csv'), 3)],
+                battery_info=input_file('battery_info.csv'), powerplant_num=5)
+
+
+@pytest.fixture
+def random_actions():
+    '''Charging and discharging actions (200, 10) with idle vehicles
+    '''
+    rng = np.random.RandomState(1)
+    return rng.uniform(-30, 60, (200, 10))*(rng.rand(200, 10) < 0.7)
+
+
+@pytest.fixture
+def random_community_kwargs(community_kwargs, tmp_path):
+    '''The small community with random daily travel distances, the vehicle files of the inputs have no deviation
+    '''
+    kwargs = dict(community_kwargs)
+    vehicle_list = [kwargs['vehicle_list'][0]]
+    for csv_file, number in kwargs['vehicle_list'][1:]:
+        vehicleType = pd.read_csv(csv_file)
+        vehicleType.loc[0, ['dist_std_wd', 'dist_std_nwd']] = 20
+        random_file = str(tmp_path/('random_'+os.path.basename(csv_file)))
+        vehicleType.to_csv(random_file, index=False)
+        vehicle_list.append((random_file, number))
+    kwargs['vehicle_list'] = vehicle_list
+    return kwargs
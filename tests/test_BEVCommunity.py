@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+
+from BEVCommunity import BEVCommunity
+from recorder import COMMENT_NAMES
+
+
+def test_vectorized_step_matches_per_vehicle_step(community_kwargs, random_actions):
+    envs = [BEVCommunity(vectorized=vectorized, **community_kwargs) for vectorized in (True, False)]
+    results = []
+    for env in envs:
+        np.random.seed(0)
+        env.reset()
+        steps = [env.step(actions) for actions in random_actions]
+        results.append((np.array([step[1] for step in steps]), np.array([step[3] for step in steps]),
+                        np.array([step[0] for step in steps])))
+    (rewards, comments, obs), (rewardsRef, commentsRef, obsRef) = results
+    np.testing.assert_allclose(rewards, rewardsRef, rtol=0, atol=1e-9)
+    np.testing.assert_allclose(comments, commentsRef, rtol=0, atol=1e-9)
+    np.testing.assert_allclose(obs, obsRef, rtol=0, atol=1e-4)
+
+
+def test_unseeded_cruise_distances_are_non_negative(community_kwargs):
+    for vectorized in (True, False):
+        env = BEVCommunity(vectorized=vectorized, **community_kwargs)
+        # Distributions mostly below zero, idle vehicles only lose electricity by driving
+        for owner in [env.fleet] + env.vehicles:
+            owner.dist_mu_wd = owner.dist_mu_nwd = owner.dist_mu_wd*0-20
+            owner.dist_sigma_wd = owner.dist_sigma_nwd = owner.dist_sigma_wd*0+40
+        np.random.seed(0)
+        env.reset()
+        soc = [env.fleet.batterySOC.copy() if vectorized else np.array([vehicle.batterySOC for vehicle in env.vehicles])]
+        for _ in range(72):
+            env.step(np.zeros(env.fleet.vehicleNum))
+            soc.append(env.fleet.batterySOC.copy() if vectorized else np.array([vehicle.batterySOC for vehicle in env.vehicles]))
+        assert np.all(np.diff(soc, axis=0) <= 0)
+        assert np.any(np.diff(soc, axis=0) < 0)
+
+        schedule = env.rollout(np.zeros((24, env.fleet.vehicleNum)))
+        assert np.all(np.diff(schedule['vehicleSOC'], axis=0) <= 0)
+
+
+@pytest.mark.parametrize('seeded', [False, True])
+def test_rollout_of_one_schedule_matches_step(random_community_kwargs, random_actions, seeded):
+    env = BEVCommunity(**random_community_kwargs)
+    np.random.seed(0)
+    env.reset(seed=1 if seeded else None)
+    for actions in random_actions[:30]:
+        env.step(actions)
+
+    schedule = random_actions[30:130]
+    results = env.rollout(schedule)
+    soc = []
+    for step_i, actions in enumerate(schedule):
+        _, reward, _, comments = env.step(actions)
+        assert results['gridLoad'][step_i] == reward
+        np.testing.assert_array_equal([results[name][step_i] for name in COMMENT_NAMES], comments)
+        soc.append(env.fleet.batterySOC.copy())
+    np.testing.assert_allclose(results['vehicleSOC'], soc, rtol=1e-6)
+
+
+@pytest.mark.parametrize('seeded', [False, True])
+def test_rollout_of_a_batch_matches_step(random_community_kwargs, random_actions, seeded):
+    env = BEVCommunity(**random_community_kwargs)
+    np.random.seed(0)
+    env.reset(seed=1 if seeded else None)
+    for actions in random_actions[:30]:
+        env.step(actions)
+    state = env.get_state()
+
+    schedules = np.stack([random_actions[30:130], random_actions[100:200], np.zeros((100, 10))])
+    results = env.rollout(schedules)
+    for schedule, gridLoad, power_batteryCharge in zip(schedules, results['gridLoad'], results['power_batteryCharge']):
+        env.set_state(state)
+        steps = [env.step(actions) for actions in schedule]
+        np.testing.assert_array_equal(gridLoad, [step[1] for step in steps])
+        np.testing.assert_array_equal(power_batteryCharge, [step[3][0] for step in steps])
+
+
+@pytest.mark.parametrize('seeded, include_rng', [(False, True), (True, True), (True, False)])
+def test_state_round_trip(random_community_kwargs, random_actions, seeded, include_rng):
+    # Without the random generator, the state only branches exactly on the distances drawn at reset
+    env = BEVCommunity(**random_community_kwargs)
+    np.random.seed(0)
+    env.reset(seed=1 if seeded else None)
+    for actions in random_actions[:50]:
+        env.step(actions)
+    state = env.get_state(include_rng=include_rng)
+
+    branches = []
+    for _ in range(2):
+        env.set_state(state)
+        steps = [env.step(actions) for actions in random_actions[50:150]]
+        branches.append((np.array([step[0] for step in steps]), np.array([step[1] for step in steps])))
+    np.testing.assert_array_equal(branches[0][0], branches[1][0])
+    np.testing.assert_array_equal(branches[0][1], branches[1][1])
+    assert len(np.unique(branches[0][1])) > 1
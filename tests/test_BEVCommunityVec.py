@@ -0,0 +1,43 @@
+import numpy as np
+
+from BEVCommunity import BEVCommunity
+from BEVCommunityVec import BEVCommunityVec
+
+
+def test_vec_env_matches_independent_communities(community_kwargs):
+    # The vehicle files of the inputs have no distance deviation, so the communities see the same distances
+    n_envs, horizon = 3, 24
+    vecEnv = BEVCommunityVec(n_envs=n_envs, seed=0, horizon=horizon, **community_kwargs)
+    envs = [BEVCommunity(horizon=horizon, **community_kwargs) for _ in range(n_envs)]
+    rng = np.random.RandomState(2)
+    actions = rng.uniform(-30, 60, (horizon+6, n_envs, 10))*(rng.rand(horizon+6, n_envs, 10) < 0.7)
+
+    obs = vecEnv.reset()
+    np.testing.assert_allclose(obs, [env.reset() for env in envs], rtol=1e-6)
+    for step_i, stepActions in enumerate(actions):
+        obs, rewards, dones, infos = vecEnv.step(stepActions)
+        for env_i, env in enumerate(envs):
+            envObs, reward, done, comments = env.step(stepActions[env_i])
+            assert rewards[env_i] == reward
+            assert dones[env_i] == done == (step_i == horizon-1)
+            np.testing.assert_allclose(infos[env_i]['comments'], comments, rtol=1e-12)
+            if done:
+                # Auto-reset: the state of the next episode is returned, the last state is kept in the info
+                np.testing.assert_allclose(infos[env_i]['terminal_observation'], envObs, rtol=1e-6)
+                envObs = env.reset()
+            np.testing.assert_allclose(obs[env_i], envObs, rtol=1e-6)
+    assert np.all(vecEnv.episode_idx == 2)
+    assert np.all(vecEnv.time_step_idx == 6)
+
+
+def test_vec_env_distances_are_seeded_per_community(random_community_kwargs):
+    actions = np.zeros((48, 3, 10))
+    socs = []
+    for _ in range(2):
+        vecEnv = BEVCommunityVec(n_envs=3, seed=0, horizon=48, **random_community_kwargs)
+        vecEnv.reset()
+        for stepActions in actions:
+            vecEnv.step(stepActions)
+        socs.append(vecEnv.fleet.batterySOC.copy())
+    np.testing.assert_array_equal(socs[0], socs[1])
+    assert not np.allclose(socs[0][0], socs[0][1])
@@ -0,0 +1,53 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from cache import ProfileCache
+
+
+def _loader(calls):
+    def loader(csv_file):
+        calls.append(csv_file)
+        return pd.read_csv(csv_file, index_col=0).iloc[:, 0].values.astype(float)
+    return loader
+
+
+def test_cache_hit_and_invalidation(tmp_path):
+    csv_file = str(tmp_path/'load.csv')
+    pd.DataFrame({'load': np.arange(24.)}).to_csv(csv_file)
+    cache_dir = str(tmp_path/'cache')
+    calls = []
+
+    cache = ProfileCache(cache_dir)
+    array = cache.getArray(csv_file, _loader(calls), 3600)
+    assert cache.getArray(csv_file, _loader(calls), 3600) is array
+    assert not array.flags.writeable
+    # A new process reads the cache file instead of parsing the input
+    np.testing.assert_array_equal(ProfileCache(cache_dir).getArray(csv_file, _loader(calls), 3600), np.arange(24.))
+    assert len(calls) == 1
+
+    pd.DataFrame({'load': np.arange(24.)+1}).to_csv(csv_file)
+    np.testing.assert_array_equal(cache.getArray(csv_file, _loader(calls), 3600), np.arange(24.)+1)
+    assert len(calls) == 2
+
+
+def test_clear_only_removes_the_cache_files(tmp_path):
+    csv_file = str(tmp_path/'load.csv')
+    pd.DataFrame({'load': np.arange(24.)}).to_csv(csv_file)
+    cache_dir = str(tmp_path/'cache')
+    cache = ProfileCache(cache_dir, max_entries=1)
+    other_file = os.path.join(cache_dir, 'notes.txt')
+    with open(other_file, 'w') as file:
+        file.write('not a cache entry')
+
+    calls = []
+    cache.getArray(csv_file, _loader(calls), 3600)
+    cache.getRecord(csv_file, lambda csv_file: {'rows': 24})
+    assert len(cache._memory) == 1
+    assert len(os.listdir(cache_dir)) == 3
+
+    cache.clear()
+    assert os.listdir(cache_dir) == ['notes.txt']
+    cache.getArray(csv_file, _loader(calls), 3600)
+    assert len(calls) == 2
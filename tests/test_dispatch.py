@@ -0,0 +1,32 @@
+import numpy as np
+
+from BEVCommunity import BEVCommunity
+from dispatch import DispatchLP
+
+
+def test_exact_schedule_replays_through_step(community_kwargs):
+    # One charger per vehicle, the fractional charger limit of the problem is then exact
+    community_kwargs['powerplant_num'] = 10
+    env = BEVCommunity(horizon=72, **community_kwargs)
+    env.fleet.dist_sigma_wd[:] = 10
+    env.fleet.dist_sigma_nwd[:] = 10
+    env.reset(seed=0)
+    lp = DispatchLP(env, 'import', exact_groups=True)
+    results = lp.solve(window=24, lookahead=24)
+
+    steps = [env.step(actions) for actions in lp.actions(results)]
+    gridLoad = np.array([step[1] for step in steps])
+    comments = np.array([step[3] for step in steps])
+    np.testing.assert_allclose(comments[:, 2], results['totalVehicleCharge'], atol=1e-6)
+    np.testing.assert_allclose(comments[:, 3], results['totalVehicletoGrid'], atol=1e-6)
+    # Only the onsite battery follows the rule of step() instead of the schedule
+    np.testing.assert_allclose(gridLoad - comments[:, 0] + comments[:, 1],
+                               results['gridLoad'] - results['power_batteryCharge'] + results['power_batteryDischarge'], atol=1e-6)
+
+
+def test_groups_do_not_depend_on_drawn_distances(community_kwargs):
+    env = BEVCommunity(horizon=72, **community_kwargs)
+    env.fleet.dist_sigma_wd[:] = 10
+    env.reset(seed=0)
+    assert DispatchLP(env).groupNum == 3
+    assert DispatchLP(env, exact_groups=True).groupNum == env.fleet.vehicleNum
@@ -0,0 +1,31 @@
+import numpy as np
+
+from feeder import BEVFeeder
+
+
+def _run(communities, actions, **kwargs):
+    feeder = BEVFeeder(communities, n_workers=2, seed=3, **kwargs)
+    try:
+        feeder.reset()
+        steps = [feeder.step(stepActions) for stepActions in actions]
+        return feeder.syncStats(), np.array([step[1] for step in steps]), [step[3] for step in steps]
+    finally:
+        feeder.close()
+
+
+def test_feeder_load_sits_at_the_import_limit(community_kwargs):
+    communities = [community_kwargs]*3
+    actions = np.random.RandomState(1).uniform(0, 60, (48, 30))
+    _, freeLoads, _ = _run(communities, actions)
+    limit = float(np.percentile(freeLoads, 60))
+    curtail_tol = 0.1
+    stats, loads, comments = _run(communities, actions, import_limit=limit, curtail_tol=curtail_tol)
+
+    chargeScales = np.array([comment['chargeScale'] for comment in comments])
+    curtailed = chargeScales < 1
+    assert curtailed.any()
+    feasible = loads <= limit + 1e-6
+    # A curtailed step ends within the tolerance under the limit, unless even no charging exceeds it
+    assert np.all(loads[curtailed & feasible] >= limit - curtail_tol)
+    assert np.all(chargeScales[~feasible] == 0)
+    assert stats['limitViolations'] == np.count_nonzero(~feasible)
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from BEVCommunity import BEVCommunity
+from metrics import KPITracker
+
+
+def test_kpis_of_a_fixed_episode(community_kwargs, random_actions):
+    env = KPITracker(BEVCommunity(horizon=48, **community_kwargs), window=24)
+    np.random.seed(0)
+    env.reset()
+    rewards = np.array([env.step(actions)[1] for actions in random_actions[:48]])
+
+    # Values of the result section of Simulation.ipynb on this episode
+    expected = {'energyIndep': 48.280670405663315, 'gridEle': 2005.2442756008277, 'buildDem': 2809.3611111111113,
+                'vehicleDem': 2593.8380042405165, 'carbonEmis': 774.0242903819195, 'carbonRedu': 1311.6105681438091,
+                'carbonRedu_veh': 7836.678121279102, 'carbonTotal': 9148.28868942291, 'grid_importEle': 2794.4983591069927,
+                'grid_exportEle': -789.2540835061649, 'gridImport_time': 29.0, 'gridImport_power': 96.36201238299975,
+                'gridExport_time': 19.0, 'gridExport_power': -41.53968860558763}
+    summary = env.summary()
+    assert summary == pytest.approx(expected, rel=1e-9)
+    assert summary['grid_importEle'] == pytest.approx(rewards[rewards > 0].sum(), rel=1e-12)
+
+    rolling = env.kpi.rolling()
+    assert rolling['steps'] == 24
+    assert rolling['gridLoad_mean'] == pytest.approx(rewards[-24:].mean(), rel=1e-12)
+    assert rolling['gridImport_peak'] == pytest.approx(212.18227216082983, rel=1e-9)
+    assert rolling['energyIndep'] == pytest.approx(41.37562229627804, rel=1e-9)
+
+    hourly = env.kpi.hourly()
+    np.testing.assert_allclose(hourly['gridPower'][[0, 12]], [9.75755298, -61.55932414], rtol=1e-8)
+    np.testing.assert_allclose(hourly['refPower'][[0, 12]], [38.47916667, -115.28125], rtol=1e-8)
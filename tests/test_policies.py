@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+
+from BEVCommunity import BEVCommunity
+from policies import NormalCharge, ResponsiveCharge, ScheduledCharge, run_episode
+
+
+# Charging modes 1-3 of check_and_charge in Simulation.ipynb: total action per vehicle, charging steps of vehicle 0, total grid load
+@pytest.mark.parametrize('policy, vehicleCharge, chargingSteps, gridLoad', [
+    (NormalCharge(), [100, 100, 100, 0, 0, 0, 0, 0, 0, 0], [0, 1, 2, 3, 4], 2714.5310434484654),
+    (ScheduledCharge(), [100, 100, 0, 0, 100, 100, 80, 0, 0, 0], [0, 1, 2, 3, 4], 2776.9810434484652),
+    (ResponsiveCharge(), [30, 25, 0, 0, 100, 100, 80, 0, 0, 0], [0, 1, 2, 3, 4, 5], 2634.6126223958336),
+])
+def test_charging_modes_of_a_fixed_episode(community_kwargs, policy, vehicleCharge, chargingSteps, gridLoad):
+    env = BEVCommunity(horizon=72, **community_kwargs)
+    # The vehicle SOCs are kept by reset, start from SOCs on both sides of the thresholds
+    soc = np.linspace(0.05, 0.95, 10)
+    env.fleet.batterySOC[:] = soc
+    env.fleet.batteryVol[:] = soc*env.fleet.batteryCapacity
+
+    results = run_episode(env, policy, seed=0, record_actions=True)
+    np.testing.assert_array_equal(results['actions'].sum(axis=0), vehicleCharge)
+    np.testing.assert_array_equal(np.flatnonzero(results['actions'][:, 0]), chargingSteps)
+    assert results['gridLoad'].sum() == pytest.approx(gridLoad, rel=1e-9)
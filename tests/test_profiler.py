@@ -0,0 +1,37 @@
+import numpy as np
+
+from BEVCommunity import BEVCommunity
+from BEVCommunityVec import BEVCommunityVec
+from profiler import StepProfiler
+
+
+def test_batched_rollout_with_profiler(community_kwargs, random_actions):
+    env = BEVCommunity(**community_kwargs)
+    profiledEnv = BEVCommunity(profiler=StepProfiler(), **community_kwargs)
+    schedules = np.stack([random_actions, random_actions*0.5])
+    results = []
+    for rolloutEnv in (env, profiledEnv):
+        np.random.seed(0)
+        results.append(rolloutEnv.rollout(schedules)['gridLoad'])
+    np.testing.assert_array_equal(results[0], results[1])
+
+
+def test_vec_env_with_profiler(community_kwargs, random_actions):
+    profiler = StepProfiler()
+    env = BEVCommunityVec(n_envs=3, seed=0, profiler=profiler, **community_kwargs)
+    env.reset()
+    for actions in random_actions[:48]:
+        env.step(np.tile(actions, (3, 1)))
+    stats = profiler.stats()
+    assert stats['steps'] == 48
+    assert stats['timers']['fleet.chargeAndDischarge']['calls'] == 48
+    assert stats['counters']['chargeRequests'] > 0
+
+
+def test_negative_soc_counted_with_given_distances(community_kwargs):
+    profiler = StepProfiler()
+    env = BEVCommunity(profiler=profiler, **community_kwargs)
+    env.reset(scenario=np.full((len(env.dayTypes), env.fleet.vehicleNum), 1000.))
+    for _ in range(48):
+        env.step(np.zeros(env.fleet.vehicleNum))
+    assert profiler.stats()['counters']['socNegative'] > 0
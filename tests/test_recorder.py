@@ -0,0 +1,19 @@
+import numpy as np
+
+from BEVCommunity import BEVCommunity
+from recorder import TrajectoryRecorder, load_trajectory
+
+
+def test_recorder_keeps_the_states_of_the_caller(community_kwargs, random_actions, tmp_path):
+    env = TrajectoryRecorder(BEVCommunity(**community_kwargs), str(tmp_path), chunkSize=64)
+    assert not env.unwrapped.reuse_obs
+    states = [env.reset()]
+    for actions in random_actions:
+        states.append(env.step(actions)[0])
+    env.close()
+
+    states = np.array(states)
+    assert len(np.unique(states, axis=0)) > 1
+    trajectory = load_trajectory(str(tmp_path))
+    assert len(trajectory) == len(random_actions)
+    np.testing.assert_array_equal(trajectory[env.obs_names].values, states[:-1])
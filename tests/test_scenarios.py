@@ -0,0 +1,16 @@
+import numpy as np
+
+from BEVCommunity import BEVCommunity
+from policies import NormalCharge
+from scenarios import evaluate_policy, generate_scenarios
+
+
+def test_evaluate_policy_restores_the_environment(community_kwargs):
+    env = BEVCommunity(horizon=72, **community_kwargs)
+    env.reset()
+    state = env.get_state(include_rng=False)
+    scenarios = generate_scenarios(env, 2, seed=0)
+    results = evaluate_policy(env, NormalCharge(), scenarios)
+    assert results['gridLoad'].shape == (2, env.n_steps)
+    assert env.distances is None
+    np.testing.assert_array_equal(env.get_state(include_rng=False), state)
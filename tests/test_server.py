@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from BEVCommunity import BEVCommunity
+from server import OP_RESET, BatchClient, EnvServer
+
+
+@pytest.fixture
+def server(community_kwargs):
+    server = EnvServer(community_kwargs, pool_size=2)
+    server.start_in_thread(('127.0.0.1', 0))
+    yield server
+    server.stop()
+
+
+def test_failed_lease_keeps_the_pool(server):
+    client = BatchClient(server.address, 1)
+    with pytest.raises(RuntimeError, match='Only 1 of the 2 environments are free'):
+        BatchClient(server.address, 2)
+    assert server.metrics()['leased'] == 1
+    assert server.metrics()['errors'] == 1
+
+    other = BatchClient(server.address, 1)
+    assert sorted(client.envIds.tolist() + other.envIds.tolist()) == [0, 1]
+    client.close()
+    other.close()
+
+
+def test_invalid_requests_are_error_replies(server, community_kwargs, random_actions):
+    client = BatchClient(server.address, 1)
+    with pytest.raises(ValueError, match='Actions need to be of shape'):
+        client.step(random_actions[:2])
+    with pytest.raises(RuntimeError, match='not leased by this client'):
+        client.connection.request(OP_RESET, 1, [np.full(1, -1, dtype=np.int64).tobytes(), np.array([1], dtype=np.uint32).tobytes()])
+
+    env = BEVCommunity(**community_kwargs)
+    np.testing.assert_array_equal(client.reset([3])[0], env.reset(seed=3))
+    for actions in random_actions[:20]:
+        obs, rewards, dones, comments = client.step(actions[None])
+        expected = env.step(actions)
+        np.testing.assert_array_equal(obs[0], expected[0])
+        assert rewards[0] == expected[1]
+    client.close()
+
+
+def test_step_after_the_episode_requires_a_reset(community_kwargs):
+    server = EnvServer(dict(community_kwargs, horizon=4), pool_size=1)
+    server.start_in_thread(('127.0.0.1', 0))
+    try:
+        client = BatchClient(server.address, 1)
+        client.reset()
+        for step_i in range(4):
+            _, _, dones, _ = client.step(np.zeros((1, 10)))
+        assert dones[0]
+        with pytest.raises(RuntimeError, match='finished, a reset is required'):
+            client.step(np.zeros((1, 10)))
+        client.reset()
+        _, _, dones, _ = client.step(np.zeros((1, 10)))
+        assert not dones[0]
+        client.close()
+    finally:
+        server.stop()
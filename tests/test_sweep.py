@@ -0,0 +1,65 @@
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from policies import NormalCharge, ScheduledCharge
+from sweep import idle_policy, run_sweep, scenario_id, scenario_seed
+
+
+def _scenario(community_kwargs):
+    scenario = dict(community_kwargs)
+    scenario['building_list'] = scenario['building_list'][:1]
+    scenario['re_list'] = scenario['re_list'][:1]
+    return scenario
+
+
+def test_scenario_id_covers_inputs_policy_and_env_kwargs(community_kwargs, tmp_path):
+    scenario = _scenario(community_kwargs)
+    baseId = scenario_id(scenario)
+    assert scenario_id(scenario, idle_policy) == baseId
+    assert scenario_id(scenario, NormalCharge()) != baseId
+    assert scenario_id(scenario, NormalCharge(charging_power=10)) != scenario_id(scenario, NormalCharge())
+    assert scenario_id(scenario, env_kwargs={'stepLenth': 900}) != baseId
+
+    # A copied file keeps the id, an edited file changes it
+    csv_file = str(tmp_path/'building.csv')
+    shutil.copy(scenario['building_list'][0][0], csv_file)
+    scenario['building_list'] = [(csv_file, 10)]
+    assert scenario_id(scenario) == baseId
+    load = pd.read_csv(csv_file, index_col=0)
+    load.iloc[0, 0] += 1
+    load.to_csv(csv_file)
+    assert scenario_id(scenario) != baseId
+
+
+def test_sweep_of_sub_hourly_profiles(community_kwargs, tmp_path):
+    scenario = _scenario(community_kwargs)
+    csv_file = str(tmp_path/'building_15min.csv')
+    load = pd.read_csv(scenario['building_list'][0][0], index_col=0)
+    pd.DataFrame({'load': np.repeat(load.iloc[:, 0].values, 4)}).to_csv(csv_file)
+    scenario['building_list'] = [(csv_file, 10)]
+    env_kwargs = {'stepLenth': 900, 'horizon': 48}
+
+    out_dir = str(tmp_path/'results')
+    summaries = list(run_sweep([scenario], out_dir=out_dir, n_workers=1, env_kwargs=env_kwargs))
+    assert len(summaries) == 1 and 'error' not in summaries[0], summaries
+    assert np.load('{}/{}.npz'.format(out_dir, summaries[0]['scenario_id']))['gridLoad'].shape == (48*4,)
+    # The finished scenario is skipped, the same scenario under another policy is run
+    assert list(run_sweep([scenario], out_dir=out_dir, n_workers=1, env_kwargs=env_kwargs)) == []
+    assert len(list(run_sweep([scenario], NormalCharge(), out_dir=out_dir, n_workers=1, env_kwargs=env_kwargs))) == 1
+
+
+def test_sweep_results_do_not_depend_on_the_global_random_state(random_community_kwargs, tmp_path):
+    scenario = _scenario(random_community_kwargs)
+    env_kwargs = {'horizon': 72}
+    results = []
+    for run_i in range(2):
+        # The forked workers start from the random state of the parent process
+        np.random.seed(run_i)
+        out_dir = str(tmp_path/'results{}'.format(run_i))
+        summary, = run_sweep([scenario], ScheduledCharge(), out_dir=out_dir, n_workers=1, env_kwargs=env_kwargs)
+        assert summary['seed'] == scenario_seed(summary['scenario_id'])
+        results.append(np.load('{}/{}.npz'.format(out_dir, summary['scenario_id'])))
+    np.testing.assert_array_equal(results[0]['gridLoad'], results[1]['gridLoad'])
+    assert results[0]['seed'] == results[1]['seed']
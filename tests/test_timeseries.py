@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from timeseries import TimeSeriesProvider
+
+
+def _reference(source, stepLenth, years=1):
+    '''Profile resampled by pandas, the first value of the next year closes the last source interval
+    '''
+    index = pd.date_range('2019-01-01', periods=len(source)+1, freq='{}s'.format(8760*3600//len(source)))
+    profile = pd.Series(np.append(source, source[0]), index=index)
+    values = profile.resample('{}s'.format(stepLenth)).interpolate().values[:-1]
+    return np.tile(values, years)
+
+
+@pytest.fixture
+def source():
+    return np.random.RandomState(0).uniform(0, 100, 8760)
+
+
+def test_sub_hourly_steps_match_pandas(source):
+    provider = TimeSeriesProvider(source, 900, 8760*4, chunkSize=1000)
+    np.testing.assert_allclose(provider[:], _reference(source, 900), rtol=1e-12)
+    # Single steps and arrays of steps across chunks
+    steps = np.array([0, 1, 999, 1000, 35039])
+    np.testing.assert_allclose(provider[steps], _reference(source, 900)[steps], rtol=1e-12)
+    assert provider[1001] == pytest.approx(_reference(source, 900)[1001], rel=1e-12)
+
+
+def test_multi_year_horizon_matches_pandas(source):
+    provider = TimeSeriesProvider(source, 1800, 3*8760*2)
+    np.testing.assert_allclose(provider[:], _reference(source, 1800, years=3), rtol=1e-12)
+    assert provider[-1] == pytest.approx(source[-1] + (source[0]-source[-1])/2, rel=1e-12)